@@ -3,14 +3,13 @@
 from datetime import datetime
 from pathlib import Path
 import math
-import yaml
 import cProfile
 import pstats
 import re
 import os
 import sys
-import itertools
 import random
+from collections import defaultdict
 
 import pprint # noqa F401
 if os.uname().sysname!='Darwin' :
@@ -136,10 +135,9 @@ def main():
             INFO(f"Successfully loaded rule configuration: {args.rulename}")
         except (ValueError, FileNotFoundError) as e:
             ERROR(f"Error: {e}")
-            exit(2)
+            exit(getattr(e, "exitcode", 2))
 
-        CHATTY("Rule configuration:")
-        CHATTY(yaml.dump(rule.dict))
+        rule.debug_dump()
 
         submitdir = Path(f'{args.submitdir}').resolve()
         if not args.dryrun:
@@ -164,8 +162,7 @@ def main():
 
         # Create a match configuration from the rule
         match_config = MatchConfig.from_rule_config(rule)
-        CHATTY("Match configuration:")
-        CHATTY(yaml.dump(match_config.dict))
+        match_config.debug_dump()
 
         # #################### Now proceed with submission
         # Determine chunk size for processing runs
@@ -226,12 +223,11 @@ def main():
                 continue
 
             ## Instead of same-size chunks, group submission files by runnumber
-            matchlist=list(rule_matches.items())
             ## Brittle! Assumes value[key][3] == runnumber
-            def keyfunc(item):
-                return item[1][3]  # x[0] is outfilename, x[1] is tuple, 4th field is runnumber
-            matchlist=sorted(matchlist, key=keyfunc)
-            matches_by_run = {k : list(g) for k, g in itertools.groupby(matchlist,key=keyfunc)}
+            ## One bucketing pass, no per-item key function and no sort needed just to group
+            matches_by_run = defaultdict(list)
+            for item in rule_matches.items():
+                matches_by_run[item[1][3]].append(item)  # item[0] is outfilename, item[1] is tuple, 4th field is runnumber
             submittable_runs=list(matches_by_run.keys())
             # Newest first
             submittable_runs=sorted(submittable_runs, reverse=True)
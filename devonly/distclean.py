@@ -3,7 +3,6 @@
 import pyodbc
 from pathlib import Path
 from datetime import datetime  # noqa: F401
-import yaml
 import cProfile
 import subprocess
 import sys
@@ -117,10 +116,9 @@ def main():
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error: {e}")
-        exit(1)
+        exit(getattr(e, "exitcode", 1))
 
-    CHATTY("Rule configuration:")
-    CHATTY(yaml.dump(rule.dict))
+    rule.debug_dump()
     
     ### Which find command to use for lustre?
     # Lustre's robin hood, rbh-find, doesn't offer advantages for our usecase, and it is more cumbersome to use.
@@ -110,7 +110,7 @@ def eradicate_runs(match_config: MatchConfig, dryrun: bool=True, delete_files: b
         
     ### 3. Select lfns in DB
     # This is necessary because the files db has no fields to select by runnumber etc.
-    existing_lfns=match_config.get_files_in_db(runlist)
+    existing_lfns=sorted(match_config.get_files_in_db(runlist))
     INFO(f"Found {len(existing_lfns)} entries in the FileCatalog")
 
     ### 4. Delete from datasets and files
@@ -207,7 +207,7 @@ def main():
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error loading rule configuration: {e}")
-        exit(1)
+        exit(getattr(e, "exitcode", 1))
 
     # Create a match configuration from the rule
     match_config = MatchConfig.from_rule_config(rule)
@@ -82,7 +82,7 @@ def main():
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error: {e}")
-        sys.exit(1)
+        sys.exit(getattr(e, "exitcode", 1))
 
     start_times = get_start_times(rule.dsttype, rule.outtriplet, rule.dataset, START_DATE)
     if start_times is None:
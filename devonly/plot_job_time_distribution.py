@@ -231,7 +231,7 @@ def main():
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error: {e}")
-        sys.exit(1)
+        sys.exit(getattr(e, "exitcode", 1))
 
     # If --runs is specified and there are multiple runs, create a multi-page PDF.
     if args.runs and 1 < len(rule.runlist_int) <= 5:
@@ -2,7 +2,6 @@
 
 from pathlib import Path
 from datetime import datetime
-import yaml
 import cProfile
 import pstats
 import sys
@@ -79,16 +78,14 @@ def main():
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error: {e}")
-        exit(1)
+        exit(getattr(e, "exitcode", 1))
 
-    CHATTY("Rule configuration:")
-    CHATTY(yaml.dump(rule.dict))
+    rule.debug_dump()
     filesystem = rule.job_config.filesystem
 
     # Create a match configuration from the rule
     match_config = MatchConfig.from_rule_config(rule)
-    CHATTY("Match configuration:")
-    CHATTY(yaml.dump(match_config.dict))
+    match_config.debug_dump()
 
     ### Use or create a list file containing all the existing files to work on.
     ### This reduces memory footprint and repeated slow `find` commands for large amounts of files
@@ -148,7 +145,7 @@ def main():
     ### Collect root files that satisfy run and dbid requirements
     mvfiles_info=[]
     for file in dstfiles:
-        lfn=Path(file).name
+        lfn=os.path.basename(file)
         dsttype,run,seg,_=parse_lfn(lfn,rule)
         if binary_contains_bisect(rule.runlist_int,run):  # Safety net to move only specified runs
             fullpath,nevents,first,last,md5,size,ctime,dbid = parse_spiderstuff(file)
@@ -179,7 +179,7 @@ def main():
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error: {e}")
-        exit(2)
+        exit(getattr(e, "exitcode", 2))
 
     # CHATTY("Rule configuration:")
     # CHATTY(yaml.dump(rule.dict))
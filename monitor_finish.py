@@ -2,7 +2,6 @@
 
 from pathlib import Path
 from datetime import datetime
-import yaml
 import cProfile
 import pstats
 import sys
@@ -106,10 +105,9 @@ def main():
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error: {e}")
-        exit(1)
+        exit(getattr(e, "exitcode", 1))
 
-    CHATTY("Rule configuration:")
-    CHATTY(yaml.dump(rule.dict))
+    rule.debug_dump()
 
     files_table = 'files'
     datasets_table = 'datasets'
@@ -14,7 +14,7 @@ from simpleLogger import slogger, CustomFormatter, CHATTY, DEBUG, INFO, WARN, ER
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from datetime import datetime
-from sphenixprodrules import check_params
+from sphenixprodrules import check_params, YamlLoader
 
 from collections import namedtuple
 SubmitDstHist = namedtuple('SubmitDstHist',['submit','dstspider','histspider','finishmon'])
@@ -46,8 +46,8 @@ def main():
     ### Parse yaml
     try:
         INFO(f"Reading rules from {args.steerfile}")
-        with open(args.steerfile, "r") as yamlstream:
-            yaml_data = yaml.safe_load(yamlstream)
+        with open(args.steerfile, "rb") as yamlstream:
+            yaml_data = yaml.load(yamlstream, Loader=YamlLoader)
     except yaml.YAMLError as yerr:
         raise ValueError(f"Error parsing YAML file: {yerr}")
     except FileNotFoundError:
@@ -1,7 +1,7 @@
 from dataclasses import dataclass, make_dataclass, field, asdict
 from typing import Optional, ClassVar, List, Any
 import math
-import pprint # noqa: F401
+import functools
 
 from simpleLogger import ERROR, WARN, CHATTY, INFO, DEBUG  # noqa: F401
 
@@ -64,7 +64,7 @@ CondorJobConfig_fields = [
     ('max_jobs',               int,            field(default=0)),
     ('max_queued_jobs',        int,            field(default=0)),
 ]
-CondorJobConfig_fieldnames= { f[0] for f in CondorJobConfig_fields }
+CondorJobConfig_fieldnames= frozenset( f[0] for f in CondorJobConfig_fields )
 
 # ----------------------------------------------------------------------------
 def condor_dict(self):
@@ -85,6 +85,21 @@ CondorJobConfig = make_dataclass(
     namespace={'condor_dict': condor_dict}
 )
 
+# ============================================================================
+@functools.lru_cache(maxsize=1024)
+def job_dirs(rungroup_tmpl: str, outdir_tmpl: str, finaldir_tmpl: str, logdir_tmpl: str, histdir_tmpl: str,
+             run: int, leafdir: str) -> tuple:
+    """ rungroup and the per-job directories. These only depend on run and leafdir,
+        so all segments of a run share one set of format calls. Keyed on the templates themselves. """
+    # Group blocks of 100 runnumbers together to control directory size
+    rungroup=rungroup_tmpl.format(a=100*math.floor(run/100), b=100*math.ceil((run+1)/100))
+    return ( rungroup,
+             outdir_tmpl  .format(rungroup=rungroup, leafdir=leafdir),
+             finaldir_tmpl.format(rungroup=rungroup, leafdir=leafdir),
+             logdir_tmpl  .format(rungroup=rungroup, leafdir=leafdir),
+             histdir_tmpl .format(rungroup=rungroup, leafdir=leafdir),
+            )
+
 # ============================================================================
 @dataclass( frozen = True )
 class CondorJob:
@@ -133,8 +148,11 @@ class CondorJob:
         """
         Constructs a CondorJob instance.
         """
-        # Group blocks of 100 runnumbers together to control directory size
-        rungroup=cls.job_config.rungroup_tmpl.format(a=100*math.floor(run/100), b=100*math.ceil((run+1)/100))
+        filesystem = cls.job_config.filesystem
+        rungroup, outdir, finaldir, logdir, histdir = job_dirs(cls.job_config.rungroup_tmpl,
+                                                               filesystem['outdir'], filesystem['finaldir'],
+                                                               filesystem['logdir'], filesystem['histdir'],
+                                                               run, leafdir)
         arguments = cls.job_config.arguments_tmpl.format(
             outbase=outbase,
             logbase=logbase,
@@ -146,10 +164,6 @@ class CondorJob:
             neventsper=cls.job_config.neventsper,
             inputs=",".join(inputs),
         )
-        outdir    = cls.job_config.filesystem['outdir'] .format(rungroup=rungroup, leafdir=leafdir)
-        finaldir  = cls.job_config.filesystem['finaldir'].format(rungroup=rungroup, leafdir=leafdir)
-        logdir    = cls.job_config.filesystem['logdir'] .format(rungroup=rungroup, leafdir=leafdir)
-        histdir   = cls.job_config.filesystem['histdir'] .format(rungroup=rungroup, leafdir=leafdir)
         log       = cls.job_config.log_tmpl.format(rungroup=rungroup, leafdir=leafdir, logbase=logbase)
 
         output    = f'{logdir}/{logbase}.out'
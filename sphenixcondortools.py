@@ -171,7 +171,7 @@ def base_batchname_from_args(args: argparse.Namespace) -> str:
         INFO(f"Successfully loaded rule configuration: {args.rulename}")
     except (ValueError, FileNotFoundError) as e:
         ERROR(f"Error loading rule configuration: {e}")
-        exit(1)
+        exit(getattr(e, "exitcode", 1))
 
     # Create a match configuration from the rule
     INFO("Match configuration created.")
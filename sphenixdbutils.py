@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 import pyodbc
 from pathlib import Path
-import pprint # noqa: F401
 
 import time
 from datetime import datetime
@@ -330,7 +329,7 @@ def jobended(dbid: int, exit_code: int, dryrun: bool = False,
                 key, _, val = line.partition(" = ")
                 key = key.strip()
                 val = val.strip().strip('"')
-                CHATTY(f"  job ad: {key!r} = {val!r}")
+                CHATTY("  job ad: %r = %r", key, val)
                 if key in ad_floats:
                     try: ad_floats[key] = float(val)
                     except ValueError: pass
@@ -481,8 +480,8 @@ def dbQuery( cnxn_string, query, ntries=5, maintenance_wait=0, dryrun=False ):
                            times before giving up. Set to 0 (default) for fast failure.
         dryrun:            If True, log the query and return None without executing.
     """
-    CHATTY(f'[cnxn_string] {cnxn_string}')
-    CHATTY(f'[query      ]\n{query}')
+    CHATTY('[cnxn_string] %s', cnxn_string)
+    CHATTY('[query      ]\n%s', query)
 
     if dryrun:
         INFO(f'[dryrun] would execute:\n{query}')
@@ -531,9 +530,22 @@ def dbQuery( cnxn_string, query, ntries=5, maintenance_wait=0, dryrun=False ):
         ERROR(f"Exhausted all attempts. Stop.")
         exit(41)
 
-    CHATTY(f'[query time ] {(datetime.now() - start).total_seconds():.2f} seconds' )
+    CHATTY('[query time ] %.2f seconds', (datetime.now() - start).total_seconds())
     return curs
 
+# ============================================================================================
+def fetch_batched( curs, batch_size: int=10000 ):
+    """
+    Iterate over the rows of a cursor, fetching them from the driver in batches.
+    Avoids both the per-row round trip of plain cursor iteration and the
+    full materialization of fetchall().
+    """
+    while True:
+        rows = curs.fetchmany( batch_size )
+        if not rows:
+            return
+        yield from rows
+
 # ============================================================================================
 def list_to_condition(lst: List[int], name: str="runnumber")  -> str :
     """
@@ -543,7 +555,7 @@ def list_to_condition(lst: List[int], name: str="runnumber")  -> str :
     string that can be used as a `WHERE` clause condition in a SQL query.
 
     Args:
-        lst: A list of positive integers. Usually runnumbers.
+        lst: A list (or contiguous range) of positive integers. Usually runnumbers.
         name: The name of the field/column in the database (usually runnumber)
 
     Returns:
@@ -552,12 +564,21 @@ def list_to_condition(lst: List[int], name: str="runnumber")  -> str :
     Examples:
         - list_to_condition([123], "runnumber") returns "and runnumber=123", [123]
         - list_to_condition([100, 200], "runnumber") returns "and runnumber>=100 and runnumber<=200", [100, 101, ..., 200]
-        - list_to_condition([1, 2, 3], "runnumber") returns "and runnumber in ( 1,2,3 )", [1, 2, 3]
+        - list_to_condition([1, 2, 3], "runnumber") returns "and runnumber>=1 and runnumber<=3"
+        - list_to_condition([1, 2, 5], "runnumber") returns "and runnumber in ( 1,2,5 )", [1, 2, 5]
+        - list_to_condition(range(100, 201), "runnumber") returns "and runnumber>=100 and runnumber<=200"
         - list_to_condition([], "runnumber") returns None
     """
 
     if isinstance(lst,int):
         lst=[ lst ]
+    elif isinstance(lst,range) and lst.step==1:
+        # Contiguous by construction, no need to look at the elements
+        if len(lst)==0:
+            return ""
+        if len(lst)==1:
+            return f"{name}={lst[0]}"
+        return f"{name}>={lst[0]} and {name}<={lst[-1]}"
     elif isinstance(lst,list):
         pass
     else:
@@ -568,10 +589,6 @@ def list_to_condition(lst: List[int], name: str="runnumber")  -> str :
     if length==0:
         return ""
 
-    if length>20000:
-        ERROR(f"Run list has {length} entries. Not a good idea. Bailing out.")
-        exit(2)
-
     if length==1:
         return f"{name}={lst[0]}"
 
@@ -580,7 +597,16 @@ def list_to_condition(lst: List[int], name: str="runnumber")  -> str :
         lst=sorted(lst) # fix user error
         return f"{name}>={lst[0]} and {name}<={lst[-1]}"
 
-    # --> list, possibly with gaps
+    # A gapless list is a range too. n distinct values spanning max-min+1 can't have holes
+    lo,hi=min(lst),max(lst)
+    if hi-lo+1==len(set(lst)):
+        return f"{name}>={lo} and {name}<={hi}"
+
+    if length>20000:
+        ERROR(f"Run list has {length} entries. Not a good idea. Bailing out.")
+        exit(2)
+
+    # --> list with gaps
     strlist=map(str,lst)
     return f"{name} in  ( {','.join(strlist)} )"
 
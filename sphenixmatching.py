@@ -1,24 +1,43 @@
 from typing import Dict, List, Tuple, Set, Any
-import itertools
-import operator
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from pathlib import Path
 import shutil
 from datetime import datetime
-import pprint # noqa: F401
-import psutil
 import math
+import os
+import yaml
+import sys
 from contextlib import nullcontext # For optional file writing
 
-from sphenixprodrules import RuleConfig, InputConfig
-from sphenixprodrules import pRUNFMT,pSEGFMT
-from sphenixdbutils import cnxn_string_map, dbQuery, list_to_condition
-from simpleLogger import CHATTY, DEBUG, INFO, WARN, ERROR, CRITICAL  # noqa: F401
+from sphenixprodrules import RuleConfig, InputConfig, shallow_dict
+from sphenixprodrules import RUNFMT,SEGFMT,pRUNFMT
+from sphenixdbutils import cnxn_string_map, dbQuery, fetch_batched, list_to_condition
+from simpleLogger import slogger, CHATTY_LEVEL_NUM, CHATTY, DEBUG, INFO, WARN, ERROR, CRITICAL  # noqa: F401
 from sphenixjobdicts import inputs_from_output, required_seb_hosts
-from sphenixmisc import binary_contains_bisect, shell_command
+from sphenixmisc import shell_command, prefetched
 
-from collections import namedtuple
+from collections import namedtuple, defaultdict
 FileHostRunSegStat = namedtuple('FileHostRunSeg',['filename','daqhost','runnumber','segment','status'])
+# _make skips the keyword-capable python __new__, noticeably cheaper when building one per db row
+make_fhrss = FileHostRunSegStat._make
+
+class ResidentMemory:
+    """ Log argument that measures resident memory (in MB) only when a record is actually emitted.
+        Also defers importing psutil until then. """
+    def __str__(self):
+        import psutil
+        return f'{psutil.Process().memory_info().rss / 1024 / 1024:.0f}'
+resident_memory = ResidentMemory()
+
+# Number of runs whose db lookups are done ahead, in threads, while matching. 1 disables it.
+RUN_PREFETCH_WORKERS = 4
+
+def logbase_formatter(outbase: str):
+    """ Returns a callable (run, seg) -> '<outbase>-<run>-<seg>'. Fixed-width %-formatting beats str.format here. """
+    fmt = f"{outbase.replace('%','%%')}-{RUNFMT}-{SEGFMT}"
+    def logbase(run: int, seg: int) -> str:
+        return fmt % (run, seg)
+    return logbase
 
 """ This file contains the classes for matching runs and files to a rule.
     MatchConfig is the steering class for db queries to
@@ -31,7 +50,7 @@ FileHostRunSegStat = namedtuple('FileHostRunSeg',['filename','daqhost','runnumbe
 
 # ============================================================================
 
-@dataclass( frozen = True )
+@dataclass( frozen = True, slots = True )
 class MatchConfig:
     dsttype:        str
     runlist_int:    str
@@ -47,6 +66,7 @@ class MatchConfig:
     dst_type_template: str
     in_types:          Any # Fixme, should always be List[str]
     input_stem:        Any
+    in_types_sql:      str # in_types as a quoted SQL list, "( 'a','b' )"
 
     # ------------------------------------------------
     @classmethod
@@ -80,13 +100,17 @@ class MatchConfig:
 
         ### Assemble leafs, where needed
         input_stem = inputs_from_output[dsttype]
-        CHATTY( f'Input files are of the form:\n{pprint.pformat(input_stem)}')
+        if slogger.isEnabledFor(CHATTY_LEVEL_NUM): # pformat is costly, only import and render it when it's shown
+            import pprint
+            CHATTY('Input files are of the form:\n%s', pprint.pformat(input_stem))
+        # Always work on a copy, input_stem is the shared module-level entry in inputs_from_output
         if isinstance(input_stem, dict):
             in_types = list(input_stem.values())
         else :
-            in_types = input_stem
+            in_types = list(input_stem)
         if 'raw' in input_config.db:
-            in_types.insert(0,'gl1daq') # all raw daq files need an extra GL1 file
+            in_types = ['gl1daq', *in_types] # all raw daq files need an extra GL1 file
+        in_types_sql = "( " + ",".join(f"'{t}'" for t in in_types) + " )"
 
         return cls(
             dsttype       = dsttype,
@@ -102,16 +126,25 @@ class MatchConfig:
             dst_type_template = dst_type_template,
             in_types = in_types,
             input_stem = input_stem,
+            in_types_sql = in_types_sql,
         )
 
     # ------------------------------------------------
     def dict(self):
-        return { k: str(v) for k, v in asdict(self).items() if v is not None }
+        # Flat view; asdict would recurse into and deep-copy the nested configs only to stringify them
+        return { k: str(v) for k, v in shallow_dict(self).items() if v is not None }
+
+    # ------------------------------------------------
+    def debug_dump(self):
+        """ CHATTY dump of the match configuration, only rendered when it's shown. """
+        CHATTY("Match configuration:")
+        if slogger.isEnabledFor(CHATTY_LEVEL_NUM):
+            CHATTY(yaml.dump(self.dict()))
 
     # ------------------------------------------------
     def good_runlist(self, subset_runlist: List[int] = None) -> Dict[int, int]:
         ### Run quality
-        CHATTY(f"Resident Memory: {psutil.Process().memory_info().rss / 1024 / 1024:.0f} MB")
+        CHATTY("Resident Memory: %s MB", resident_memory)
         # Here would be a  good spot to check against golden or bad runlists and to enforce quality cuts on the runs
 
         # Use subset if provided, otherwise use full runlist
@@ -143,14 +176,14 @@ order by runnumber
         runlist_int = [ run for run in runlist_to_check if run in goodruns ]
         if not runlist_int:
             return {}
-        INFO(f"{len(runlist_int)} runs pass run quality cuts.")
-        CHATTY(f"Runlist: {runlist_int}")
+        INFO("%s runs pass run quality cuts.", len(runlist_int))
+        CHATTY("Runlist: %s", runlist_int)
         return { run: goodruns[run] for run in runlist_int }
 
     # ------------------------------------------------
-    def get_files_in_db(self, runnumbers: Any) :
+    def exist_query(self, columns: str, runnumbers: Any) -> str:
         ## Note: Not all constraints are needed, but they may speed up the query
-        exist_query  = f"""select filename from datasets
+        exist_query  = f"""select {columns} from datasets
         where dataset='{self.dataset}'
         and tag='{self.outtriplet}'
         and dsttype like '{self.dst_type_template}'"""
@@ -158,9 +191,46 @@ order by runnumber
         run_condition=list_to_condition(runnumbers)
         if run_condition!="" :
             exist_query += f"\n\tand {run_condition}"
-        existing_output = [ c.filename for c in dbQuery( cnxn_string_map['fcr'], exist_query ) ]
-        existing_output.sort()
-        return existing_output
+        return exist_query
+
+    # ------------------------------------------------
+    def run_infile_query(self, infile_query: str, runnumber: int) -> str:
+        """ Input file query for one run, narrowed server-side to the segments that can still make a job. """
+        run_query = infile_query + f"\n\t and runnumber={runnumber} "
+        conditions = []
+        if len(self.in_types) > 1:
+            # Only segments present for every stream of the run can make a job. Let the server drop the rest.
+            # Streams are counted over all of cand, i.e. before any already produced segment is excluded.
+            conditions.append("""segment in ( select segment from cand group by segment
+                           having count(distinct daqhost) = ( select count(distinct daqhost) from cand ) )""")
+        if self.input_config.db == 'fcr':
+            # Inputs and outputs both live in the FileCatalog. Let the server drop (run, segment) pairs
+            # whose output is already registered instead of shipping their inputs over just to discard them.
+            # This removes whole segments and is evaluated next to, not before, the stream filter above;
+            # every stream must stay in cand, or one whose segments are all done would drop out of the count.
+            # The per-run existing_segs check in matches() stays as the authoritative test.
+            conditions.append(f"""not exists ( select 1 from datasets done
+            where done.runnumber=cand.runnumber
+              and done.segment=cand.segment
+              and done.dataset='{self.dataset}'
+              and done.tag='{self.outtriplet}'
+              and done.dsttype like '{self.dst_type_template}' )""")
+        if not conditions:
+            return run_query
+        return f"""with cand as ( {run_query} )
+        select * from cand
+        where """ + "\n          and ".join(conditions) + "\n"
+
+    # ------------------------------------------------
+    def get_files_in_db(self, runnumbers: Any) :
+        # A set: callers only test membership, once per candidate output
+        return { c.filename for c in fetch_batched( dbQuery( cnxn_string_map['fcr'], self.exist_query('filename', runnumbers) ) ) }
+
+    # ------------------------------------------------
+    def get_segments_in_db(self, runnumbers: Any) -> Set[Tuple[int,int]] :
+        # (runnumber, segment) of existing output. Only unambiguous if the dsttype is, i.e. not for combining rules.
+        # Smaller than full filenames, and candidates can be tested before their names are formatted.
+        return { (c.runnumber, c.segment) for c in fetch_batched( dbQuery( cnxn_string_map['fcr'], self.exist_query('runnumber,segment', runnumbers) ) ) }
 
     # ------------------------------------------------
     def get_output_files(self, filemask: str = r"\*.root:\*", dstlistname: str=None, dryrun: bool=True) -> List[str]:
@@ -172,15 +242,15 @@ order by runnumber
             lfind = shutil.which('find')
         else:
             lfind = f'{lfind} find'
-            INFO(f'Using find={find} and lfind={lfind}.')
+            INFO('Using find=%s and lfind=%s.', find, lfind)
 
         if dstlistname:
-            INFO(f"Piping output to {dstlistname}")
+            INFO("Piping output to %s", dstlistname)
             if not dryrun:
                 Path(dstlistname).unlink(missing_ok=True)
             else:
                 dstlistname="/dev/null"
-                INFO(f"Dryrun. Piping output to {dstlistname}")
+                INFO("Dryrun. Piping output to %s", dstlistname)
 
         outlocation=self.filesystem['outdir']
         # Further down, we will simplify by assuming finaldir == outdir, otherwise this script shouldn't be used.
@@ -190,26 +260,33 @@ order by runnumber
             print(f"finaldir = {finaldir}")
             print(f"outdir = {outlocation}")
             exit(1)
-        INFO(f"Directory tree: {outlocation}")
+        INFO("Directory tree: %s", outlocation)
 
         # All leafs:
         leafparent=outlocation.split('/{leafdir}')[0]
         leafdirs_cmd=rf"{find} {leafparent} -type d -name {self.dsttype}\* -mindepth 1 -a -maxdepth 1"
         leafdirs = shell_command(leafdirs_cmd)
-        CHATTY(f"Leaf directories: \n{pprint.pformat(leafdirs)}")
+        if slogger.isEnabledFor(CHATTY_LEVEL_NUM):
+            import pprint
+            CHATTY("Leaf directories: \n%s", pprint.pformat(leafdirs))
 
         # Run groups that we're interested in
         sorted_runlist = sorted(self.runlist_int)
         def rungroup(run):
             return self.rungroup_tmpl.format(a=100*math.floor(run/100), b=100*math.ceil((run+1)/100))
         desirable_rungroups = { rungroup(run) for run in sorted_runlist }
-        runs_by_group = { group : [] for group in desirable_rungroups}
-        outidentifier=f'{self.dataset}_{self.outtriplet}'
+        runs_by_group = { group : set() for group in desirable_rungroups}
+        outidentifier=f'{self.dataset}_{self.outtriplet}-'
+        runstr_len=len(outidentifier)+len(f'{0:{pRUNFMT}}')
         for run in sorted_runlist:
-            # runs_by_group[rungroup(run)].append(str(run))
-            runstr=f'{outidentifier}-{run:{pRUNFMT}}'
+            # runs_by_group[rungroup(run)].add(str(run))
+            runstr=f'{outidentifier}{run:{pRUNFMT}}'
             ## could also add segment, runstr+=f'-{segment:{pSEGFMT}}'
-            runs_by_group[rungroup(run)].append(runstr)
+            runs_by_group[rungroup(run)].add(runstr)
+        def runstr_of(filename):
+            # Cut out the '<dataset>_<outtriplet>-<run>' piece so it can be looked up instead of substring-tested against every run
+            i=filename.rfind(outidentifier)
+            return filename[i:i+runstr_len] if i>=0 else None
 
         # INFO(f"Size of the filter dictionary is {sys.getsizeof(runs_by_group)} bytes")
         # INFO(f"Length of the filter dictionary is {len(runs_by_group.keys())}")
@@ -223,26 +300,26 @@ order by runnumber
         tstart=datetime.now()
         with open(dstlistname,"w") if dstlistname else nullcontext() as dstlistfile:
             for leafdir in leafdirs :
-                CHATTY(f"Searching {leafdir}")
+                CHATTY("Searching %s", leafdir)
                 available_rungroups = shell_command(rf"{find} {leafdir} -name run_\* -type d -mindepth 1 -a -maxdepth 1")
-                DEBUG(f"Resident Memory: {psutil.Process().memory_info().rss / 1024 / 1024:.0f} MB")
+                DEBUG("Resident Memory: %s MB", resident_memory)
                 
-                # Want to have the subset of available rungroups where a desirable rungroup is a substring (cause the former have the full path)
-                rungroups = {rg for rg in available_rungroups if any( drg in rg for drg in desirable_rungroups) }
-                DEBUG(f"For {leafdir}, we have {len(rungroups)} run groups to work on")                
+                # Want to have the subset of available rungroups whose directory name is a desirable rungroup (the former have the full path)
+                rungroups = {rg for rg in available_rungroups if os.path.basename(rg) in desirable_rungroups }
+                DEBUG("For %s, we have %s run groups to work on", leafdir, len(rungroups))                
                 for rungroup in rungroups:
-                    runs_str=runs_by_group[Path(rungroup).name]
+                    runs_str=runs_by_group[os.path.basename(rungroup)]
                     find_command=f"{lfind} {rungroup} -type f -name {filemask}"
                     CHATTY(find_command)
                     group_runs = shell_command(find_command)
                     # Enforce run number constraint
-                    group_runs = [ run for run in group_runs if any( dr in run for dr in runs_str) ]
+                    group_runs = [ run for run in group_runs if runstr_of(run) in runs_str ]
                     if dstlistfile:
                         for run in group_runs:
                             dstlistfile.write(f"{run}\n")
                     else:
                         ret += group_runs
-        INFO(f"List creation took {(datetime.now() - tstart).total_seconds():.2f} seconds.")
+        INFO("List creation took %.2f seconds.", (datetime.now() - tstart).total_seconds())
         return ret
 
     # ------------------------------------------------
@@ -250,9 +327,9 @@ order by runnumber
                                        runnumber: int) -> Dict[str, List[FileHostRunSegStat]]:
         gl1_files = files_for_run.pop('gl1daq',None)
         if gl1_files is None:
-            WARN(f"No GL1 files found for run {runnumber}. Skipping this run.")
+            WARN("No GL1 files found for run %s. Skipping this run.", runnumber)
             return {}
-        CHATTY(f'All GL1 files for for run {runnumber}:\n{gl1_files}')
+        CHATTY('All GL1 files for for run %s:\n%s', runnumber, gl1_files)
 
         # We need to determine which segments are present
         segments=set()
@@ -261,7 +338,7 @@ order by runnumber
                 if f.status==1:
                     segments.add(f.segment)
         if segments:
-            CHATTY(f"Run {runnumber} has {len(segments)} segments in the input streams: {sorted(segments)}")
+            CHATTY("Run %s has %s segments in the input streams: %s", runnumber, len(segments), sorted(segments))
 
         #segswitch="seg0fromdb"
 
@@ -270,7 +347,7 @@ order by runnumber
     # ------------------------------------------------
     def get_prod_status(self, runnumbers):
         ### Check production status
-        DEBUG(f'Checking for output already in production for {runnumbers}')
+        DEBUG('Checking for output already in production for %s', runnumbers)
         run_condition=list_to_condition(runnumbers)
         jobs_run_condition   = f"and {run_condition}" if run_condition != "" else ""
 
@@ -282,7 +359,7 @@ order by runnumber
         order by runnumber desc;"""
 
         now=datetime.now()
-        existing_status = { c.filename : c.status for c in dbQuery( cnxn_string_map['statr'], jobs_query ) }
+        existing_status = { c.filename : c.status for c in fetch_batched( dbQuery( cnxn_string_map['statr'], jobs_query ) ) }
         legacy_status = {}
         if getattr(self.input_config, 'check_legacy', False):
             legacy_run_condition = f"and {run_condition.replace('runnumber','run')}" if run_condition != "" else ""
@@ -291,10 +368,10 @@ order by runnumber
             where dstname like '{self.dst_type_template}%{self.outtriplet}'
                 {legacy_run_condition} {self.input_config.status_query_constraints}
             order by run desc;"""
-            legacy_status   = { c.dstfile  : c.status for c in dbQuery( cnxn_string_map['statr'], legacy_query ) }
+            legacy_status   = { c.dstfile  : c.status for c in fetch_batched( dbQuery( cnxn_string_map['statr'], legacy_query ) ) }
 
         elapsed = (datetime.now() - now).total_seconds()
-        (WARN if elapsed > 60 else DEBUG)(f'Query took {elapsed:.2f} seconds.')
+        (WARN if elapsed > 60 else DEBUG)('Query took %.2f seconds.', elapsed)
         # production_jobs takes precedence; legacy fills in any gaps
         return { **legacy_status, **existing_status }
 
@@ -317,7 +394,7 @@ order by runnumber
             lustre_query =   "select runnumber,daqhost from datasets"
             lustre_query += f" WHERE {run_condition}"
             lustre_query += f" AND segment=0 AND status::int > 0"
-            lustre_query += f" AND daqhost in {tuple(self.in_types)}"
+            lustre_query += f" AND daqhost in {self.in_types_sql}"
             lustre_result = dbQuery( cnxn_string_map[ self.input_config.db ], lustre_query ).fetchall()
             daqhosts_for_combining = {}
             for r,h in lustre_result:
@@ -325,7 +402,7 @@ order by runnumber
                     daqhosts_for_combining[r] = set()
                 daqhosts_for_combining[r].add(h)
             for run in daqhosts_for_combining:
-                CHATTY(f"Available on lustre for run {run}: {daqhosts_for_combining.get(run,set())}")
+                CHATTY("Available on lustre for run %s: %s", run, daqhosts_for_combining.get(run, set()))
 
             return daqhosts_for_combining, eventsinrun_by_run
 
@@ -334,13 +411,13 @@ order by runnumber
         # Original query to DAQ database's filelist table
         # seg_query=   "select runnumber,hostname,count(sequence) from filelist"
         # seg_query+= f" WHERE {run_condition}"
-        # seg_query+= f" and hostname in {tuple(self.in_types)}"
+        # seg_query+= f" and hostname in {self.in_types_sql}"
         # seg_query+=  " group by runnumber,hostname;"
         # seg_result = dbQuery( cnxn_string_map['daqr'], seg_query ).fetchall()
         # New query to raw database's datasets table
         seg_query_raw=   "select runnumber,daqhost,count(segment) from datasets"
         seg_query_raw+= f" WHERE {run_condition}"
-        seg_query_raw+= f" and daqhost in {tuple(self.in_types)}"
+        seg_query_raw+= f" and daqhost in {self.in_types_sql}"
         seg_query_raw+=  " group by runnumber,daqhost;"
         seg_result = dbQuery( cnxn_string_map['rawr'], seg_query_raw ).fetchall()
         run_segs = {}
@@ -352,7 +429,7 @@ order by runnumber
         ### How many segments are actually present in the file catalog?
         lustre_query_raw =   "select runnumber,daqhost,count(status) from datasets"
         lustre_query_raw += f" where {run_condition}"
-        lustre_query_raw += f" and daqhost in {tuple(self.in_types)}"
+        lustre_query_raw += f" and daqhost in {self.in_types_sql}"
         lustre_query_raw += f" and status::int > 0" # Assuming 'status' column exists and is relevant in raw db's datasets table
         lustre_query_raw +=  " group by runnumber,daqhost;"
         lustre_result = dbQuery( cnxn_string_map['rawr'], lustre_query_raw ).fetchall()
@@ -366,17 +443,17 @@ order by runnumber
         ## For a given host, all segments must be present
         daqhosts_for_combining = {}
         for r, hosts in run_segs.items():
-            CHATTY(f"Produced segments for run {r}: {hosts}")
+            CHATTY("Produced segments for run %s: %s", r, hosts)
             if r in lustre_segs:
-                CHATTY(f"Available on lustre for run {r}: {lustre_segs[r]}")
+                CHATTY("Available on lustre for run %s: %s", r, lustre_segs[r])
                 for h, s in hosts.items():
                     if h in lustre_segs[r]:
                         if s == lustre_segs[r][h]:
                             daqhosts_for_combining[r] = daqhosts_for_combining.get(r, set())
                             daqhosts_for_combining[r].add(h)
-                            CHATTY(f"Run {r} has all {s} segments for host {h}. Using this host.")
+                            CHATTY("Run %s has all %s segments for host %s. Using this host.", r, s, h)
                         else:
-                            CHATTY(f"Run {r} host {h} has only {lustre_segs[r][h]} out of {s} segments on lustre. Not using this host.")
+                            CHATTY("Run %s host %s has only %s out of %s segments on lustre. Not using this host.", r, h, lustre_segs[r][h], s)
 
         return daqhosts_for_combining, eventsinrun_by_run
 
@@ -386,7 +463,8 @@ order by runnumber
         start=datetime.now()
 
         # ---- Raw DAQ / combining path ----
-        if 'raw' in self.input_config.db:
+        is_raw = 'raw' in self.input_config.db
+        if is_raw:
             rule_matches = {}
             segswitch="seg0fromdb"
             if not self.input_config.combine_seg0_only:
@@ -395,55 +473,55 @@ order by runnumber
             if not daqhosts_for_combining:
                 WARN("No runs satisfy the segment availability criteria. No jobs to submit.")
                 return {}
-            INFO(f"{len(daqhosts_for_combining)} runs satisfy the segment availability criteria.")
-
-            for runnumber in sorted(daqhosts_for_combining, reverse=True):
-                CHATTY(f"Currently to be created: {len(rule_matches)} output files.")
+            INFO("%s runs satisfy the segment availability criteria.", len(daqhosts_for_combining))
+
+            # Output names only depend on the leaf, set them up once instead of per run
+            leaf_outbase = {}
+            for leaf in self.input_stem:
+                outbase = f'{self.dsttype}_{leaf}_{self.dataset}_{self.outtriplet}'
+                leaf_outbase[leaf] = outbase, logbase_formatter(outbase)
+
+            ## Check against production status and existing files.
+            # Combining makes only one output per leaf and run, so fetch both for all runs at once
+            # instead of two round trips per run. Filenames carry the run number, lookups stay exact.
+            combine_runs = sorted(daqhosts_for_combining, reverse=True)
+            existing_output=self.get_files_in_db(combine_runs)
+            DEBUG("Already have %s output files for %s runs", len(existing_output), len(combine_runs))
+            existing_status=self.get_prod_status(combine_runs)
+            DEBUG("Already have %s output files in the production db", len(existing_status))
+
+            for runnumber in combine_runs:
+                CHATTY("Currently to be created: %s output files.", len(rule_matches))
                 if self.job_config.max_jobs>0 and len(rule_matches) > self.job_config.max_jobs:
-                    INFO(f"Number jobs is {len(rule_matches)}; exceeds max_jobs = {self.job_config.max_jobs}. Return.")
+                    INFO("Number jobs is %s; exceeds max_jobs = %s. Return.", len(rule_matches), self.job_config.max_jobs)
                     break
 
                 # GL1 is a must
                 if not 'gl1daq' in daqhosts_for_combining[runnumber]:
-                    DEBUG(f"No GL1 file(s) for run {runnumber}")
+                    DEBUG("No GL1 file(s) for run %s", runnumber)
                     continue
 
-                ## Now check against production status and existing files
-                existing_output=self.get_files_in_db(runnumber)
-                if existing_output==[]:
-                    DEBUG(f"No output files yet for run {runnumber}")
-                else:
-                    DEBUG(f"Already have {len(existing_output)} output files for run {runnumber}")
-
-                existing_status=self.get_prod_status(runnumber)
-                if existing_status=={}:
-                    DEBUG(f"No output files yet in the production db for run {runnumber}")
-                else:
-                    DEBUG(f"Already have {len(existing_status)} output files in the production db")
-
                 for leaf, daqhost in self.input_stem.items():
                     if daqhost=='gl1daq': # It needs to exist, but it doesn't need a separate job
                         continue
                     if daqhost not in daqhosts_for_combining[runnumber]:
-                        CHATTY(f"No inputs from {daqhost} for run {runnumber}.")
+                        CHATTY("No inputs from %s for run %s.", daqhost, runnumber)
                         continue
                     # We still could explicitly query the input files from the db here, but we already know that all segments are present
-                    dsttype  = f'{self.dsttype}_{leaf}'
-                    dsttype += f'_{self.dataset}'
-                    outbase=f'{dsttype}_{self.outtriplet}'
+                    outbase, leaf_logbase = leaf_outbase[leaf]
                     # For combining, use segment 0 as key for logs and for existing output
-                    logbase=f'{outbase}-{runnumber:{pRUNFMT}}-{0:{pSEGFMT}}'
+                    logbase=leaf_logbase(runnumber, 0)
                     dstfile=f'{logbase}.root'
                     if dstfile in existing_output:
-                        CHATTY(f"Output file {dstfile} already exists. Not submitting.")
+                        CHATTY("Output file %s already exists. Not submitting.", dstfile)
                         continue
                     if dstfile in existing_status:
-                        WARN(f"Output file {dstfile} already has production status {existing_status[dstfile]}. Not submitting.")
+                        WARN("Output file %s already has production status %s. Not submitting.", dstfile, existing_status[dstfile])
                         continue
-                    DEBUG(f"Creating {dstfile} for run {runnumber}.")
+                    DEBUG("Creating %s for run %s.", dstfile, runnumber)
                     rule_matches[dstfile] = [segswitch], outbase, logbase, runnumber, 0, daqhost, self.dsttype+'_'+leaf, eventsinrun_by_run.get(runnumber)
 
-            INFO(f'[Parsing time ] {(datetime.now() - start).total_seconds():.2f} seconds')
+            INFO('[Parsing time ] %.2f seconds', (datetime.now() - start).total_seconds())
             return rule_matches
 
         # ---- Downstream / non-raw path ----
@@ -460,10 +538,13 @@ order by runnumber
 
         # Manipulate the input types to match the database
         in_types=self.in_types # local copy, member is frozen
+        # Only daq file lists need GL1 files, and those are handled above. Check once, not per run.
+        if 'gl1daq' in in_types:
+            ERROR("This should not happen.")
+            exit(1)
 
-        # Transform list to ('<v1>','<v2>', ...) format. (one-liner doesn't work in python 3.9)
-        in_types_str = f'( QUOTE{"QUOTE,QUOTE".join(in_types)}QUOTE )'
-        in_types_str = in_types_str.replace("QUOTE","'")
+        # ('<v1>','<v2>', ...) format, rendered once with the MatchConfig
+        in_types_str = self.in_types_sql
 
         intriplet=self.input_config.intriplet
 
@@ -472,8 +553,8 @@ order by runnumber
         if not goodruns:
             INFO("No runs pass run quality cuts.")
             return {}
-        DEBUG(f"{len(goodruns)} runs in runlist.")
-        CHATTY(f"Runlist: {list(goodruns)}")
+        DEBUG("%s runs in runlist.", len(goodruns))
+        CHATTY("Runlist: %s", list(goodruns))
 
         # eventsinrun: look up from prod DB if we have an intriplet (informational only, best-effort)
         eventsinrun_by_run = {}
@@ -488,7 +569,7 @@ order by runnumber
                 ORDER BY runnumber, id DESC;"""
             rows = dbQuery(cnxn_string_map['statr'], upstream_query).fetchall()
             eventsinrun_by_run = {int(r.runnumber): r.eventsinrun for r in rows}
-            DEBUG(f"eventsinrun found in prod DB for {len(eventsinrun_by_run)} runs.")
+            DEBUG("eventsinrun found in prod DB for %s runs.", len(eventsinrun_by_run))
 
         # Need status==1 for all files in a given run,host combination
         # Easier to check that after the SQL query
@@ -502,88 +583,104 @@ order by runnumber
 
         #### Now build up potential output files from what's available
         rule_matches = {}
+        # outbase=f'{self.dsttype}_{self.outtriplet}_{self.outdataset}'
+        outbase=f'{self.dsttype}_{self.dataset}_{self.outtriplet}'
+        run_seg_logbase = logbase_formatter(outbase)
 
         ### Runnumber is the prime differentiator
-        INFO(f"Resident Memory: {psutil.Process().memory_info().rss / 1024 / 1024} MB")
-        for runnumber in sorted(goodruns, reverse=True):
-            INFO(f"Processing run {runnumber}.")
-            CHATTY(f"Currently to be created: {len(rule_matches)} output files.")
-            if self.job_config.max_jobs>0 and len(rule_matches) > self.job_config.max_jobs:
-                INFO(f"Number jobs is {len(rule_matches)}; exceeds max_jobs = {self.job_config.max_jobs}. Return.")
-                break
-
+        INFO("Resident Memory: %s MB", resident_memory)
+        is_seed = 'TRKR_SEED' in self.dsttype
+        def fetch_run(runnumber):
+            """ All per-run db lookups, so they can run ahead of the processing below in worker threads. """
             # Potential input files for this run
-            run_query = infile_query + f"\n\t and runnumber={runnumber} "
+            run_query = self.run_infile_query(infile_query, runnumber)
             qnow=datetime.now()
-            db_result = dbQuery( cnxn_string_map[ self.input_config.db ], run_query ).fetchall()
+            # Build the candidates straight from the cursor in batches, no intermediate fetchall() copy
+            # There are only a few dozen distinct streams; interning makes the grouping compare pointers.
+            candidates = [ make_fhrss((c.filename,sys.intern(c.daqhost),c.runnumber,c.segment,c.status))
+                           for c in fetch_batched( dbQuery( cnxn_string_map[ self.input_config.db ], run_query ) ) ]
             elapsed = (datetime.now() - qnow).total_seconds()
-            (WARN if elapsed > 60 else DEBUG)(f'Infile query took {elapsed:.2f} seconds.')
-            candidates = [ FileHostRunSegStat(c.filename,c.daqhost,c.runnumber,c.segment,c.status) for c in db_result ]
-            CHATTY(f"Run: {runnumber}, Resident Memory: {psutil.Process().memory_info().rss / 1024 / 1024} MB")
+            (WARN if elapsed > 60 else DEBUG)('Infile query for run %s took %.2f seconds.', runnumber, elapsed)
             if len(candidates) == 0 :
-                DEBUG(f"No input files found for run {runnumber}. Skipping run.")
-                continue
-            DEBUG(f"Found {len(candidates)} input files for run {runnumber}.")
+                return candidates, None, None, None
 
             # Files to be created are checked against this list. Could use various attributes but most straightforward is just the filename
-            existing_output=self.get_files_in_db(runnumber)
-            if existing_output==[]:
-                DEBUG(f"No output files yet for run {runnumber}")
+            existing_segs=self.get_segments_in_db(runnumber)
+            existing_status=self.get_prod_status(runnumber)
+
+            ## daqhost_query=f"select hostname,serverid from hostinfo where runnumber={runnumber}"
+            ## daqhost_serverid=[ (c.hostname,c.serverid) for c in dbQuery( cnxn_string_map['daqr'], daqhost_query).fetchall() ]
+            # The 'daqhost' column in 'datasets' already contains the combined hostname_serverid for e.g. ebdc hosts.
+            raw_daqhosts = None
+            if not is_seed:
+                daqhost_query_raw=f"select distinct daqhost from datasets where runnumber={runnumber}"
+                raw_daqhosts=[ c.daqhost for c in dbQuery( cnxn_string_map['rawr'], daqhost_query_raw).fetchall() ]
+            return candidates, existing_segs, existing_status, raw_daqhosts
+
+        # The db round trips dominate; fetch a few runs ahead in threads while the current one is processed.
+        # Runs are still handled newest first and one at a time, so the max_jobs cut behaves as before.
+        for runnumber, (candidates, existing_segs, existing_status, raw_daqhosts) in prefetched(fetch_run, sorted(goodruns, reverse=True), RUN_PREFETCH_WORKERS):
+            INFO("Processing run %s.", runnumber)
+            CHATTY("Currently to be created: %s output files.", len(rule_matches))
+            if self.job_config.max_jobs>0 and len(rule_matches) > self.job_config.max_jobs:
+                INFO("Number jobs is %s; exceeds max_jobs = %s. Return.", len(rule_matches), self.job_config.max_jobs)
+                break
+
+            CHATTY("Run: %s, Resident Memory: %s MB", runnumber, resident_memory)
+            if len(candidates) == 0 :
+                DEBUG("No input files found for run %s. Skipping run.", runnumber)
+                continue
+            DEBUG("Found %s input files for run %s.", len(candidates), runnumber)
+
+            if not existing_segs:
+                DEBUG("No output files yet for run %s", runnumber)
             else:
-                DEBUG(f"Already have {len(existing_output)} output files for run {runnumber}")
+                DEBUG("Already have %s output files for run %s", len(existing_segs), runnumber)
 
-            existing_status=self.get_prod_status(runnumber)
             if existing_status=={}:
-                DEBUG(f"No output files yet in the production db for run {runnumber}")
+                DEBUG("No output files yet in the production db for run %s", runnumber)
             else:   
-                DEBUG(f"Already have {len(existing_status)} output files in the production db")
+                DEBUG("Already have %s output files in the production db", len(existing_status))
 
             ### Simplest case, 1-to-1:For every segment, there is exactly one output file, and exactly one input file from the previous step
             # If the output doesn't exist yet, use input files to create the job
             # TODO: or 'CALOFITTING' or many other job types
-            if 'TRKR_SEED' in self.dsttype:
+            if is_seed:
                 for infile in candidates:
                     if infile.segment % self.input_config.cut_segment != 0:
-                        DEBUG(f"Skipping: segment {infile.segment} is not divisible by {self.input_config.cut_segment}")
+                        DEBUG("Skipping: segment %s is not divisible by %s", infile.segment, self.input_config.cut_segment)
                         continue
-                    outbase=f'{self.dsttype}_{self.dataset}_{self.outtriplet}'
-                    logbase= f'{outbase}-{infile.runnumber:{pRUNFMT}}-{infile.segment:{pSEGFMT}}'
-                    dstfile = f'{logbase}.root'
-                    if binary_contains_bisect(existing_output,dstfile):
-                        CHATTY(f"Output file {dstfile} already exists. Not submitting.")
+                    # Already done is the common case in incremental production, test before formatting any names
+                    if (infile.runnumber, infile.segment) in existing_segs:
+                        CHATTY("Output for run %s, segment %s already exists. Not submitting.", infile.runnumber, infile.segment)
                         continue
+                    logbase= run_seg_logbase(infile.runnumber, infile.segment)
+                    dstfile = f'{logbase}.root'
                     if dstfile in existing_status:
-                        DEBUG(f"Production status of {dstfile} is {existing_status[dstfile]}. Not submitting.")
+                        DEBUG("Production status of %s is %s. Not submitting.", dstfile, existing_status[dstfile])
                         continue
                     in_files_for_seg=[infile]
-                    CHATTY(f"Creating {dstfile} from {in_files_for_seg}")
+                    CHATTY("Creating %s from %s", dstfile, in_files_for_seg)
                     rule_matches[dstfile] = ["dbinput"], outbase, logbase, infile.runnumber, infile.segment, "dummy", self.dsttype, eventsinrun_by_run.get(infile.runnumber)
                 continue
 
             ####### NOT 1-1, requires more work:
             # For every segment, there is exactly one output file, and exactly one input file _from each stream_ OR from the previous step
             ######## Cut up the candidates into streams/daqhost≈ƒs
-            candidates.sort(key=lambda x: (x.runnumber, x.daqhost)) # itertools.groupby depends on data being sorted
-            files_for_run = { k : list(g) for
-                              k, g in itertools.groupby(candidates, operator.attrgetter('daqhost')) }
-            
-            # daq file lists all need GL1 files. Pull them out and add them to the others
-            if ( 'gl1daq' in in_types_str ):
-                ERROR("This should not happen.")
-                exit(1)
+            # All candidates share the run number (one query per run), so the stream is the only key.
+            # Bucket in one pass, no need to sort just to group.
+            files_for_run = defaultdict(list)
+            for c in candidates:
+                files_for_run[c.daqhost].append(c)
 
             ####### "Easy" case. One way to identify this case is to see if gl1 is not needed
             #  If the input has a segment number, then the output will have the same segment number
             #  - These are downstream objects (input is already a DST)
             #  - This can be 1-1 or many-to-1 (usually 2-1 for SEED + CLUSTER --> TRACKS)
             ### Get available input
-            DEBUG("Getting available daq hosts for run {runnumber}")
+            DEBUG("Getting available daq hosts for run %s", runnumber)
 
-            ## daqhost_query=f"select hostname,serverid from hostinfo where runnumber={runnumber}"
-            ## daqhost_serverid=[ (c.hostname,c.serverid) for c in dbQuery( cnxn_string_map['daqr'], daqhost_query).fetchall() ]
-            # The 'daqhost' column in 'datasets' already contains the combined hostname_serverid for e.g. ebdc hosts.
-            daqhost_query_raw=f"select distinct daqhost from datasets where runnumber={runnumber}"
-            raw_daqhosts=[ c.daqhost for c in dbQuery( cnxn_string_map['rawr'], daqhost_query_raw).fetchall() ]
+            # raw_daqhosts were looked up with the other per-run queries in fetch_run
 
             available_tpc=set()
             available_tracking=set()
@@ -602,12 +699,12 @@ order by runnumber
                 if not 'gl1' in daqhost_name:
                     available_tracking.add(daqhost_name)
                 
-            DEBUG (f"Found {len(available_tpc)} TPC hosts in the run db")
-            CHATTY(f"{available_tpc}")
-            DEBUG (f"Found {len(available_tracking)} other tracking hosts in the run db")
-            CHATTY(f"{available_tracking}")
-            DEBUG (f"Found {len(available_seb)} sebXX hosts in the run db")
-            CHATTY(f"{available_seb}")
+            DEBUG ("Found %s TPC hosts in the run db", len(available_tpc))
+            CHATTY("%s", available_tpc)
+            DEBUG ("Found %s other tracking hosts in the run db", len(available_tracking))
+            CHATTY("%s", available_tracking)
+            DEBUG ("Found %s sebXX hosts in the run db", len(available_seb))
+            CHATTY("%s", available_seb)
             ### Here we could enforce both mandatory and masked hosts
 
             # Calo hardcoding
@@ -617,10 +714,10 @@ order by runnumber
                 # 1. How many required SEB hosts are turned on in this run according to the daq db?
                 available_required_seb = available_seb.intersection(required_seb)
                 if len(available_required_seb) < min_seb and not self.physicsmode=='cosmics':
-                    WARN(f"Skip run {runnumber}. Only {len(available_required_seb)} required SEB hosts turned on in the run.")
+                    WARN("Skip run %s. Only %s required SEB hosts turned on in the run.", runnumber, len(available_required_seb))
                     missing_hosts = sorted(required_seb.difference(available_required_seb))
                     if missing_hosts:
-                        WARN(f"Missing required SEB hosts: {missing_hosts}")
+                        WARN("Missing required SEB hosts: %s", missing_hosts)
                     continue
 
                 # 2. How many required SEB host files have been produced and are currently available in this run.
@@ -631,12 +728,12 @@ order by runnumber
                             present_seb_files.add(required)
                             continue
                 if len(present_seb_files) < min_seb and not self.physicsmode=='cosmics':
-                    WARN(f"Skip run {runnumber}. Only {len(present_seb_files)} required SEB detectors actually in the run.")
+                    WARN("Skip run %s. Only %s required SEB detectors actually in the run.", runnumber, len(present_seb_files))
                     missing_hosts = sorted(required_seb.difference(present_seb_files))
                     if missing_hosts:
-                        WARN(f"Missing required SEB hosts: {missing_hosts}")
+                        WARN("Missing required SEB hosts: %s", missing_hosts)
                     continue
-                DEBUG (f"Found {len(present_seb_files)} required SEB files in the catalog")
+                DEBUG ("Found %s required SEB files in the catalog", len(present_seb_files))
 
 
             # TPC hardcoding
@@ -647,7 +744,7 @@ order by runnumber
                 ### Important note: Requirement is NOT enforced for cosmics.
                 minNTPC=48
                 if len(available_tpc) < minNTPC and not self.physicsmode=='cosmics':
-                    WARN(f"Skip run {runnumber}. Only {len(available_tpc)} TPC detectors turned on in the run.")
+                    WARN("Skip run %s. Only %s TPC detectors turned on in the run.", runnumber, len(available_tpc))
                     continue
                 
                 # 2. How many are TPC hosts are actually there in this run.
@@ -660,58 +757,52 @@ order by runnumber
                             present_tpc_files.add(host)
                             continue                
                 if len(present_tpc_files) < minNTPC and not self.physicsmode=='cosmics':
-                    WARN(f"Skip run {runnumber}. Only {len(present_tpc_files)} TPC detectors actually in the run.")
+                    WARN("Skip run %s. Only %s TPC detectors actually in the run.", runnumber, len(present_tpc_files))
                     missing_hosts = [host for host in available_tpc if not any(host in present for present in present_tpc_files)]
                     if missing_hosts:
-                        CHATTY(f"Missing TPC hosts: {missing_hosts}")
+                        CHATTY("Missing TPC hosts: %s", missing_hosts)
                     continue
-                DEBUG (f"Found {len(present_tpc_files)} TPC files in the catalog")
+                DEBUG ("Found %s TPC files in the catalog", len(present_tpc_files))
 
                 # 3. For INTT, MVTX, enforce that they're all available if possible
                 present_tracking=set(files_for_run).symmetric_difference(present_tpc_files)
-                CHATTY(f"Available non-TPC hosts in the daq db: {present_tracking}")
+                CHATTY("Available non-TPC hosts in the daq db: %s", present_tracking)
                 ### TODO: Only checking length here. Probably okay forever though.
                 if len(present_tracking) != len(available_tracking) and not self.physicsmode=='cosmics':
-                    WARN(f"Skip run {runnumber}. Only {len(present_tracking)} non-TPC detectors actually in the run. {len(available_tracking)} possible.")
+                    WARN("Skip run %s. Only %s non-TPC detectors actually in the run. %s possible.", runnumber, len(present_tracking), len(available_tracking))
                     missing_hosts = [host for host in available_tracking if not any(host in present for present in present_tracking)]
                     if missing_hosts:
-                        WARN(f"Missing non-TPC hosts: {missing_hosts}")
+                        WARN("Missing non-TPC hosts: %s", missing_hosts)
                     continue
-                DEBUG (f"Found {len(present_tracking)} other tracking files in the catalog")
-
-            # Sort and group the input files by segment. Reject if not all hosts are present in the segment yet
-            segments = None
-            rejected = set()
-            for host in files_for_run:
-                files_for_run[host].sort(key=lambda x: (x.segment))
-                new_segments = list(map(lambda x: x.segment, files_for_run[host]))
-                if segments is None:
-                    segments = new_segments
-                elif segments != new_segments:
-                    rejected.update( set(segments).symmetric_difference(set(new_segments)) )
-                    segments = list( set(segments).intersection(new_segments))
+                DEBUG ("Found %s other tracking files in the catalog", len(present_tracking))
+
+            # Group the input files by segment. Reject if not all hosts are present in the segment yet
+            # Usable segments are those present for every host, the rest is rejected.
+            # The query already enforces this for multi-stream inputs, kept as the authoritative check.
+            segs_by_host = [ {f.segment for f in host_files} for host_files in files_for_run.values() ]
+            segments = set.intersection(*segs_by_host)
+            rejected = set.union(*segs_by_host) - segments
 
             if len(rejected) > 0  and not self.physicsmode=='cosmics' :
-                DEBUG(f"Run {runnumber}: Removed {len(rejected)} segments not present in all streams.")
-                CHATTY(f"Rejected segments: {rejected}")
+                DEBUG("Run %s: Removed %s segments not present in all streams.", runnumber, len(rejected))
+                CHATTY("Rejected segments: %s", rejected)
 
             # If the output doesn't exist yet, use input files to create the job
-            # outbase=f'{self.dsttype}_{self.outtriplet}_{self.outdataset}'
-            outbase=f'{self.dsttype}_{self.dataset}_{self.outtriplet}'
-            for seg in segments:
+            for seg in sorted(segments):
                 if seg % self.input_config.cut_segment != 0:
                     continue
-                logbase= f'{outbase}-{runnumber:{pRUNFMT}}-{seg:{pSEGFMT}}'
-                dstfile = f'{logbase}.root'
-                if dstfile in existing_output:
-                    CHATTY(f"Output file {dstfile} already exists. Not submitting.")
+                # Already done is the common case in incremental production, test before formatting any names
+                if (runnumber, seg) in existing_segs:
+                    CHATTY("Output for run %s, segment %s already exists. Not submitting.", runnumber, seg)
                     continue
+                logbase= run_seg_logbase(runnumber, seg)
+                dstfile = f'{logbase}.root'
                 if dstfile in existing_status:
-                    CHATTY(f"Output file {dstfile} already has production status {existing_status[dstfile]}. Not submitting.")
+                    CHATTY("Output file %s already has production status %s. Not submitting.", dstfile, existing_status[dstfile])
                     continue
                 rule_matches[dstfile] = ["dbinput"], outbase, logbase, runnumber, seg, "dummy", self.dsttype, eventsinrun_by_run.get(runnumber)
             # \for run
-        INFO(f'[Parsing time ] {(datetime.now() - start).total_seconds():.2f} seconds')
+        INFO('[Parsing time ] %.2f seconds', (datetime.now() - start).total_seconds())
 
         return rule_matches
 # ============================================================================
@@ -720,7 +811,7 @@ def parse_lfn(lfn: str, rule: RuleConfig) -> Tuple[str,...] :
     # If there's a colon, throw everything away after the first one; that's another parser's problem
     try:
         name=lfn.split(':')[0]
-        name=Path(name).name # could throw an error instead if we're handed a full path.
+        name=os.path.basename(name) # could throw an error instead if we're handed a full path.
         #  split at, and remove, run3auau_new_nocbdtag_v001, remainder is 'DST_...', '-00066582-00000.root' (or .finished)
         # dsttype,runsegend=name.split(f'_{rule.outtriplet}_{rule.dataset}')
         dsttype,runsegend=name.split(f'_{rule.dataset}_{rule.outtriplet}')
@@ -742,12 +833,14 @@ def parse_spiderstuff(filename: str) -> Tuple[str,...] :
     try:
         size=-1
         ctime=-1
-        if 'size' in filename and 'ctime'in filename:
-            lfn,_,nevents,_,first,_,last,_,md5,_,size,_,ctime,_,dbid = filename.split(':')
+        # One split; the field count tells the long (size, ctime) form from the short one
+        parts=filename.split(':')
+        if len(parts)==15:
+            lfn,_,nevents,_,first,_,last,_,md5,_,size,_,ctime,_,dbid = parts
         else:
-            lfn,_,nevents,_,first,_,last,_,md5,_,dbid = filename.split(':')
+            lfn,_,nevents,_,first,_,last,_,md5,_,dbid = parts
 
-        lfn=Path(lfn).name
+        lfn=os.path.basename(lfn)
     except Exception as e:
         ERROR(f"Error: {e}")
         print(filename)
@@ -4,6 +4,8 @@ from datetime import datetime
 from logging.handlers import RotatingFileHandler
 import subprocess
 import bisect # for binary search in sorted lists
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from simpleLogger import slogger, CustomFormatter, CHATTY, DEBUG, INFO, WARN, ERROR, CRITICAL  # noqa: F401
 
@@ -158,6 +160,36 @@ def make_chunks(lst, n):
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
 
+# ============================================================================================
+def prefetched(func, items, workers: int=4):
+    """
+    Yields (item, func(item)) in the order of items, computing up to `workers` results ahead in threads.
+    Meant for I/O bound work like db queries; the consumer may stop early, then at most
+    `workers` results have been computed in vain. Exceptions surface when their item is reached.
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    it = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit_next():
+            for item in it:
+                pending.append((item, executor.submit(func, item)))
+                return
+        try:
+            for _ in range(workers):
+                submit_next()
+            while pending:
+                item, future = pending.popleft()
+                submit_next() # keep the window full while the consumer works
+                yield item, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
 # ============================================================================================
 def binary_contains_bisect(arr, x):
     pos = bisect.bisect_left(arr, x)
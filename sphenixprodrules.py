@@ -1,14 +1,26 @@
 import yaml
 import re
+import os
+import json
+import copy
+import logging
+import hashlib
+import tempfile
+import functools
 import glob
-from typing import Dict, List, Tuple, Any, Optional
-from dataclasses import dataclass, asdict
-from pathlib import Path
 import stat
-import subprocess
-import pprint # noqa: F401
+from typing import Dict, List, Tuple, Any, Optional, Sequence, Iterable
+from dataclasses import dataclass, fields
+from pathlib import Path
+from types import MappingProxyType
+
+# libyaml-backed loader is several times faster; fall back to the pure-Python one
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
-from simpleLogger import CHATTY, DEBUG, INFO, WARN, ERROR, CRITICAL  # noqa: F401
+from simpleLogger import slogger, CHATTY_LEVEL_NUM, CHATTY, DEBUG, INFO, WARN, ERROR, CRITICAL  # noqa: F401
 from sphenixjobdicts import inputs_from_output, required_seb_hosts
 from sphenixcondorjobs import CondorJobConfig,CondorJobConfig_fieldnames,glob_arguments_tmpl
 
@@ -23,6 +35,64 @@ from sphenixcondorjobs import CondorJobConfig,CondorJobConfig_fieldnames,glob_ar
 # Striving to keep Dataclasses immutable (frozen=True)
 # All modifications and should be done in the constructor
 
+# ============================================================================
+# Parsed YAML files, keyed by absolute path: (st_mtime_ns, st_size, data)
+# Repeat loads of an unchanged file skip parsing entirely.
+_yaml_cache: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+
+# Across processes, parsed files are kept as JSON (much faster to load than YAML) in the user's cache directory,
+# tagged with the same mtime and size. Only written when the data survives a JSON round trip unchanged.
+# Set SPHENIXPROD_NO_YAML_CACHE to any non-empty value to neither read nor write these files.
+def _json_cache_dir() -> Optional[Path]:
+    """ $XDG_CACHE_HOME/sphenixprod/yaml, or ~/.cache/...; None if disabled or there is no usable home (condor, cron). """
+    if os.environ.get("SPHENIXPROD_NO_YAML_CACHE"):
+        return None
+    try:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    except (RuntimeError, KeyError, OSError): # Path.home() without HOME or passwd entry
+        return None
+    return Path(base) / "sphenixprod" / "yaml"
+
+def _json_sidecar(cache_dir: Path, yaml_path: str) -> Path:
+    return cache_dir / f"{hashlib.sha1(yaml_path.encode()).hexdigest()}.json"
+
+def _load_json_sidecar(yaml_path: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+    cache_dir = _json_cache_dir()
+    if cache_dir is None:
+        return None
+    try:
+        with open(_json_sidecar(cache_dir, yaml_path), "rb") as jsonstream:
+            cached = json.load(jsonstream)
+    except (OSError, ValueError):
+        return None
+    if cached.get("source") != yaml_path or cached.get("mtime_ns") != st.st_mtime_ns or cached.get("size") != st.st_size:
+        return None
+    CHATTY("Using cached parse of %s", yaml_path)
+    return cached.get("data")
+
+def _write_json_sidecar(yaml_path: str, st: os.stat_result, yaml_data: Dict[str, Any]):
+    cache_dir = _json_cache_dir()
+    if cache_dir is None:
+        return
+    tmpname = None
+    try:
+        payload = json.dumps({"source": yaml_path, "mtime_ns": st.st_mtime_ns, "size": st.st_size, "data": yaml_data})
+        if json.loads(payload)["data"] != yaml_data: # e.g. dates or non-string keys
+            return
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and move it in place so concurrent readers never see a partial file
+        fd, tmpname = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as jsonstream:
+            jsonstream.write(payload)
+        os.replace(tmpname, _json_sidecar(cache_dir, yaml_path))
+    except (OSError, TypeError, ValueError) as e:
+        DEBUG("Not caching parsed %s: %s", yaml_path, e)
+        if tmpname is not None:
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+
 # ============================================================================
 # shared format strings and default filesystem paths
 RUNFMT = '%08i'
@@ -31,63 +101,158 @@ VERFMT = '03d'
 pRUNFMT = RUNFMT.replace('%','').replace('i','d')
 pSEGFMT = SEGFMT.replace('%','').replace('i','d')
 
+# Run numbers in a --runlist file that isn't purely white-space separated. Matched on the raw bytes, int() takes those directly
+_runlist_number_re = re.compile(rb"[-+]?\d+")
+
 # "{leafdir}" needs to stay changeable.  Typical leafdir: DST_STREAMING_EVENT_TPC20 or DST_TRKR_CLUSTER
 # "{rungroup}" needs to stay changeable. Typical rungroup: run_00057900_00058000
 # Target example:
 # /sphenix/lustre01/sphnxpro/{prodmode} / {period}  / {runtype} / outtriplet={build}_{dbtag}_{version} / {leafdir}       /     {rungroup}       /
 # /sphenix/lustre01/sphnxpro/production / run3auau  /  cosmics  /        new_nocdbtag_v000          / DST_CALOFITTING / run_00057900_00058000/
-_default_filesystem = {
+_default_filesystem = MappingProxyType({ # read-only, from_yaml builds a per-rule copy
     'outdir'   :    "/sphenix/lustre01/sphnxpro/{prodmode}/{period}/{physicsmode}/{outtriplet}/{leafdir}/{rungroup}",
     'finaldir' :    "/sphenix/lustre01/sphnxpro/{prodmode}/{period}/{physicsmode}/{outtriplet}/{leafdir}/{rungroup}",
     'logdir'   : "/sphenix/data/data02/sphnxpro/{prodmode}/{period}/{physicsmode}/{outtriplet}/{leafdir}/{rungroup}/log",
     'histdir'  : "/sphenix/data/data02/sphnxpro/{prodmode}/{period}/{physicsmode}/{outtriplet}/{leafdir}/{rungroup}/hist",
     'condor'   :          "/tmp/data02/sphnxpro/{prodmode}/{period}/{physicsmode}/{outtriplet}/{leafdir}/{rungroup}/log",
-}
+})
+
+# ============================================================================
+class RuleConfigError(ValueError):
+    """ A rule can't be built. Raised instead of exiting so callers decide what to do;
+        exitcode is the submission exit code (see README) a CLI should end with.
+    """
+    def __init__(self, message: str, exitcode: int = 2):
+        super().__init__(message)
+        self.exitcode = exitcode
 
 # ============================================================================
-def is_executable(file_path):
-  """
-    Checks if a file is executable.
+class KeepPlaceholders(dict):
+    """ Substitution mapping for str.format_map that leaves unknown placeholders, e.g. '{rungroup}', in place.
+        Note: Only works for bare placeholders; a format spec would be applied to the '{key}' string.
+    """
+    def __missing__(self, key):
+        return '{' + key + '}'
 
-    Args:
-        file_path (str or Path): The path to the file.
+# ============================================================================
+@functools.lru_cache(maxsize=1)
+def git_branch() -> str:
+    """ Branch of the checkout this code runs from, "main" if it can't be determined. Looked up once per process. """
+    import subprocess # only needed here, once per process
+    branch_name="main"
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(Path(__file__).parent), "rev-parse", "--abbrev-ref", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        branch_name = result.stdout.strip()
+        CHATTY("Current Git branch: %s", branch_name)
+    except Exception as e:
+        WARN("Could not determine the git branch, assuming %s: %s", branch_name, e)
+    return branch_name
 
-    Returns:
-        bool: True if the file is executable, False otherwise.
-  """
-  path = Path(file_path)
+# ============================================================================
+@functools.lru_cache(maxsize=None)
+def input_dsttypes(dsttype: str) -> Tuple[Tuple[str,...], str]:
+    """ Input dst types for an output dsttype, and their comma-joined form. inputs_from_output is fixed, so cache. """
+    try:
+        input_stem = inputs_from_output[dsttype]
+    except KeyError:
+        raise ValueError(f"No known inputs for dsttype '{dsttype}'.")
+    if isinstance(input_stem, dict):
+        indsttype = tuple(input_stem.values())
+    elif isinstance(input_stem, list):
+        indsttype = tuple(input_stem)
+    else:
+        raise ValueError(f"Unrecognized type of input file descriptor {type(input_stem)} for '{dsttype}'.")
+    # f"('{indsttype_str}')" would be nice for SQL, but adding parens doesn't play well with handover to condor
+    return indsttype, ",".join(indsttype)
 
-  if not path.is_file():
-    return False
+# ============================================================================
+def find_in_payload(payload_list: List[str], name: str) -> Optional[str]:
+    """
+    Finds a regular file by name in the payload, like 'find <payload> -type f' would,
+    but in-process and stopping at the first hit.
 
-  st = path.stat()
-  return bool(st.st_mode & stat.S_IXUSR or
-              st.st_mode & stat.S_IXGRP or
-              st.st_mode & stat.S_IXOTH)
+    Args:
+        payload_list: Files, directories, or glob patterns thereof.
+        name: The file name to look for.
+
+    Returns:
+        The path of the first match, or None.
+    """
+    def walk_error(e):
+        WARN("Error while searching the payload: %s", e)
+
+    for loc in payload_list:
+        roots = sorted(glob.glob(loc))
+        if not roots:
+            WARN("Payload location %s does not exist", loc)
+        for root in roots:
+            if not os.path.isdir(root):
+                if os.path.basename(root) == name and os.path.isfile(root) and not os.path.islink(root):
+                    return root
+                continue
+            for dirpath, _, filenames in os.walk(root, onerror=walk_error):
+                if name in filenames:
+                    candidate = os.path.join(dirpath, name)
+                    if os.path.isfile(candidate) and not os.path.islink(candidate):
+                        return candidate
+    return None
 
 # ============================================================================
-def check_params(params_data: Dict[str, Any], required: List[str], optional: List[str] ) -> bool:
+# Allowed fields of the yaml rule blocks, for check_params
+_params_required = frozenset({"dsttype", "period","build", "dbtag", "version"})
+_params_optional = frozenset({"dataset", "physicsmode"})
+_input_optional  = frozenset({"db", "table", "intriplet",
+                              "min_run_events","min_run_time",
+                              "direct_path", "dataset",
+                              "combine_seg0_only","choose20",
+                              "cut_segment",
+                              "infile_query_constraints",
+                              "status_query_constraints","physicsmode",
+                              "min_seb"})
+_job_required    = frozenset({"script", "payload", "neventsper","log","priority",
+                              # "request_memory",  ## request_memory should be required; but we'll check on it later because "mem" is a deprecated synonym
+                              })
+
+def check_params(params_data: Dict[str, Any], required: Iterable[str], optional: Optional[Iterable[str]] ) -> bool:
     """
     Check that all required parameters are present, and no unexpected ones.
     """
-    check_clean = True
-    for f in required:
-        if f not in params_data:
-            check_clean = False
-            raise ValueError(f"Missing required field '{f}'.")
-    # Have to iterate over a copy since we are deleting fields
-    if optional:
-        for f in params_data.copy():
-            if f not in optional + required:
-                WARN( f"Unexpected field '{f}' in params. Removing, but you should clean up the yaml")
-                # raise ValueError(f"Unexpected field '{f}'.")
-                check_clean = False
-                del params_data[f]
-
-    return check_clean
+    required = frozenset(required)
+    missing = required - params_data.keys()
+    if missing:
+        raise ValueError("Missing required field " + ", ".join(f"'{f}'" for f in sorted(missing)) + ".")
+    if not optional:
+        return True
+
+    # A new set, so it is safe to delete fields while iterating
+    unexpected = params_data.keys() - required.union(optional)
+    for f in sorted(unexpected):
+        WARN( "Unexpected field '%s' in params. Removing, but you should clean up the yaml", f)
+        # raise ValueError(f"Unexpected field '{f}'.")
+        del params_data[f]
+
+    return not unexpected
+
+# ============================================================================
+@functools.cache
+def _field_names(cls) -> Tuple[str, ...]:
+    """ Field names of a dataclass type, looked up once per class. """
+    return tuple(f.name for f in fields(cls))
+
+def shallow_dict(obj) -> Dict[str, Any]:
+    """
+    Field name -> value mapping of a dataclass instance.
+    Unlike dataclasses.asdict, nested objects are neither converted nor copied.
+    """
+    return { name: getattr(obj, name) for name in _field_names(type(obj)) }
 
 # ============================================================================
-@dataclass( frozen = True )
+@dataclass( frozen = True, slots = True )
 class InputConfig:
     """Represents the input configuration block in the YAML."""
     db: str
@@ -111,7 +276,7 @@ class InputConfig:
     min_seb:      Optional[int] = 20                  # Minimum number of SEB hosts required for CALOFITTING
 
 # ============================================================================
-@dataclass( frozen = True )
+@dataclass( frozen = True, slots = True )
 class RuleConfig:
     """Represents a single rule configuration in the YAML."""
 
@@ -126,7 +291,7 @@ class RuleConfig:
     build_string: str   # ana472, new
     version_string: str # v000
     outtriplet: str     # new_2025p000_v000
-    runlist_int: List[int] # name chosen to differentiate it from --runlist which points to a text file
+    runlist_int: Sequence[int] # list, or range for --runs min max. Name chosen to differentiate it from --runlist which points to a text file
     
     # Nested dataclasses
     input_config: InputConfig
@@ -139,13 +304,26 @@ class RuleConfig:
 
     # ------------------------------------------------
     def dict(self) -> Dict[str, Any]:
-        """Convert to a dictionary, handling nested dataclasses."""
-        data = asdict(self)
-
-        data['input'] = asdict(self.input_config)
-        data['job']   = asdict(self.job_config)
+        """Convert to a dictionary, handling nested dataclasses.
+        Shallow on purpose: all members are frozen, asdict's recursive deep copy buys nothing."""
+        data = shallow_dict(self)
+        if isinstance(self.runlist_int, range): # readable when dumped; only materialized here
+            data['runlist_int'] = list(self.runlist_int)
+
+        # The legacy 'input'/'job' keys get their own deep copy; shared objects would be dumped as yaml anchors/aliases
+        data['input_config'] = shallow_dict(self.input_config)
+        data['job_config']   = shallow_dict(self.job_config)
+        data['input']        = copy.deepcopy(data['input_config'])
+        data['job']          = copy.deepcopy(data['job_config'])
         return data
 
+    # ------------------------------------------------
+    def debug_dump(self):
+        """ CHATTY dump of the full configuration. yaml.dump is costly, so it's only rendered when it's shown. """
+        CHATTY("Rule configuration:")
+        if slogger.isEnabledFor(CHATTY_LEVEL_NUM):
+            CHATTY(yaml.dump(self.dict()))
+
     # ------------------------------------------------
     @classmethod
     def from_yaml(cls,
@@ -175,10 +353,9 @@ class RuleConfig:
             param_overrides = {}
 
         ### Extract and validate top level rule parameters
-        params_data = rule_data.get("params", {})
-        check_params(params_data
-                    , required=["dsttype", "period","build", "dbtag", "version"]
-                    , optional=["dataset", "physicsmode"] )
+        # Shallow copies: fields get removed and renamed below, yaml_data itself stays untouched
+        params_data = dict(rule_data.get("params", {}))
+        check_params(params_data, required=_params_required, optional=_params_optional)
 
         ### Verify build tag exists on cvmfs before going further
         build_tag = params_data["build"]
@@ -186,13 +363,13 @@ class RuleConfig:
             f"/cvmfs/sphenix.sdcc.bnl.gov/alma9.2-gcc-14.2.0/release/release_*/{build_tag}"
         )
         if not cvmfs_matches:
-            CRITICAL(
+            raise RuleConfigError(
                 f"Build tag '{build_tag}' not found under "
                 f"/cvmfs/sphenix.sdcc.bnl.gov/alma9.2-gcc-14.2.0/release/release_*/ — "
-                f"check spelling or cvmfs availability."
+                f"check spelling or cvmfs availability.",
+                exitcode=3,
             )
-            exit(3)
-        INFO(f"Build tag '{build_tag}' found: {cvmfs_matches[0]}")
+        INFO("Build tag '%s' found: %s", build_tag, cvmfs_matches[0])
 
         ### Fill derived data fields
         build_string=params_data["build"].replace(".","")
@@ -202,27 +379,28 @@ class RuleConfig:
         ### Which runs to process?
         runs=param_overrides["runs"]
         runlist_filename=param_overrides.get("runlist")
-        INFO(f"runs = {runs}")
-        INFO(f"runlist = {runlist_filename}")
+        INFO("runs = %s", runs)
+        INFO("runlist = %s", runlist_filename)
         runlist_int=None
         ## By default, run over "physics" runs in run3
         default_runmin=66456
         default_runmax=90000
         if runlist_filename: # white-space separated numbers from a file
-            INFO(f"Processing runs from file: {runlist_filename}")
+            INFO("Processing runs from file: %s", runlist_filename)
             try:
-                with open(runlist_filename, 'r') as file:
+                with open(runlist_filename, 'rb') as file:
                     content = file.read()
             except FileNotFoundError:
-                ERROR(f"Error: Runlist file not found at {runlist_filename}")
-                exit(10)
+                raise RuleConfigError(f"Runlist file not found at {runlist_filename}", exitcode=10)
             try:
-                number_strings = re.findall(r"[-+]?\d+", content)
-                runlist_int=[int(runstr) for runstr in number_strings]
+                try: # The documented format, white-space separated numbers, only needs a split
+                    runlist_int=list(map(int, content.split()))
+                except ValueError: # commas, comments, ...: pick out the numbers
+                    runlist_int=list(map(int, _runlist_number_re.findall(content)))
             except Exception as e:
-                ERROR(f"Error: Exception parsing runlist file {runlist_filename}: {e}")
+                ERROR("Error: Exception parsing runlist file %s: %s", runlist_filename, e)
         else: # Use "--runs". 0 for all default runs; 1, 2 numbers for a single run or a range; 3+ for an explicit list
-            INFO(f"Processing runs argument: {runs}")
+            INFO("Processing runs argument: %s", runs)
             if not runs:
                 WARN("Processing all runs.")
                 runs=['-1','-1']
@@ -230,25 +408,23 @@ class RuleConfig:
             if  nargs==1:
                 runlist_int=[int(runs[0])]
                 if runlist_int[0]<=0 :
-                    ERROR(f"Can't run on single run {runlist_int[0]}")
+                    ERROR("Can't run on single run %s", runlist_int[0])
             elif nargs==2:
                 runmin,runmax=tuple(map(int,runs))
                 if runmin<0:
                     runmin=default_runmin
-                    WARN(f"Using runmin={runmin}")
+                    WARN("Using runmin=%s", runmin)
                 if runmax<0:
                     runmax=default_runmax
-                    WARN(f"Using runmax={runmax}")
-                runlist_int=list(range(runmin, runmax+1))
+                    WARN("Using runmax=%s", runmax)
+                runlist_int=range(runmin, runmax+1) # no need to materialize the full run range
             else :
                 # dense command here, all it does is make a list of unique ints, and sort it
-                runlist_int=sorted(set(map(int,runs)))
                 # Remove non-positive entries while we're at it
-                runlist_int=[r for r in runlist_int if r>=0]
+                runlist_int=sorted({ r for r in map(int,runs) if r>=0 })
         if not runlist_int or runlist_int==[]:
-            ERROR("Something's wrong parsing the runs to be processed. Maybe runmax < runmin?")
-            exit(10)
-        CHATTY(f"Runlist: {runlist_int}")
+            raise RuleConfigError("Something's wrong parsing the runs to be processed. Maybe runmax < runmin?", exitcode=10)
+        CHATTY("Runlist: %s", runlist_int)
 
         ### Optionals
         physicsmode = params_data.get("physicsmode", "physics")
@@ -256,31 +432,16 @@ class RuleConfig:
 
         ###### Now create InputConfig and CondorJobConfig
         # Extract and validate input_config
-        input_data = rule_data.get("input", {})
-        check_params(input_data
-                    , required=[]
-                    , optional=["db", "table", "intriplet",
-                                "min_run_events","min_run_time",
-                                "direct_path", "dataset",
-                                "combine_seg0_only","choose20",
-                                "cut_segment",
-                                "infile_query_constraints",
-                                "status_query_constraints","physicsmode",
-                                "min_seb"] )
+        input_data = dict(rule_data.get("input", {}))
+        check_params(input_data, required=(), optional=_input_optional)
 
         intriplet=input_data.get("intriplet")
         dsttype=params_data["dsttype"]
-        input_stem = inputs_from_output[dsttype]
-        CHATTY( f'Input files are of the form:\n{pprint.pformat(input_stem)}')
-        if isinstance(input_stem, dict):
-            indsttype = list(input_stem.values())
-        elif isinstance(input_stem, list):
-            indsttype = input_stem
-        else:
-            ERROR("Unrecognized type of input file descriptor {type(input_stem)}")
-            exit(2)
-        indsttype_str=",".join(indsttype)
-        # indsttype_str=f"('{indsttype_str}')" ## Commented out. Adding parens here doesn't play well with handover to condor
+        indsttype, indsttype_str = input_dsttypes(dsttype)
+        indsttype = list(indsttype) # private copy, the cached tuple is shared
+        if slogger.isEnabledFor(CHATTY_LEVEL_NUM): # pformat is costly, only import and render it when it's shown
+            import pprint
+            CHATTY('Input files are of the form:\n%s', pprint.pformat(inputs_from_output[dsttype]))
 
         min_run_events=input_data.get("min_run_events",100000)
         min_run_time=input_data.get("min_run_time",300)
@@ -296,8 +457,7 @@ class RuleConfig:
         if argv_choose20 :
             choose20=True
         if choose20:
-            CRITICAL("Option choose20 shouldn't be used.")
-            exit(2)
+            raise RuleConfigError("Option choose20 shouldn't be used.")
             ### Use choose20 only for combination jobs.
             if 'raw' in input_data["db"]:
                 WARN ("Selecting only 20% of good runs.")
@@ -324,20 +484,20 @@ class RuleConfig:
         check_legacy = param_overrides.get("check_legacy", False)
         if input_direct_path is not None:
             input_direct_path = input_direct_path.format(mode=physicsmode)
-            DEBUG (f"Using direct path {input_direct_path}")
+            DEBUG ("Using direct path %s", input_direct_path)
 
         # Allow arbitrary query constraints to be added
         infile_query_constraints  = input_data.get("infile_query_constraints", "")
         infile_query_constraints += param_overrides.get("infile_query_constraints", "")
         status_query_constraints = input_data.get("status_query_constraints", "")
         status_query_constraints += param_overrides.get("status_query_constraints", "")
-        DEBUG(f"Input query constraints: {infile_query_constraints}" )
-        DEBUG(f"Status query constraints: {status_query_constraints}" )
+        DEBUG("Input query constraints: %s", infile_query_constraints )
+        DEBUG("Status query constraints: %s", status_query_constraints )
 
         default_min_seb = len(required_seb_hosts(dsttype)) or 20
         min_seb = input_data.get("min_seb", default_min_seb)
         if "min_seb" in input_data and min_seb != default_min_seb:
-            WARN(f"Non-default min_seb={min_seb} (default is {default_min_seb}).")
+            WARN("Non-default min_seb=%s (default is %s).", min_seb, default_min_seb)
 
         input_config=InputConfig(
             db=inferred_db,
@@ -359,14 +519,8 @@ class RuleConfig:
         )
 
         # Extract and validate job_config
-        job_data = rule_data.get("job", {})
-        check_params(job_data
-                    , required=[
-                        "script", "payload", "neventsper","log","priority",
-                        # "request_memory",  ## request_memory should be required; but we'll check on it later because "mem" is a deprecated synonym
-                    ],
-                     optional=None
-                    )
+        job_data = dict(rule_data.get("job", {}))
+        check_params(job_data, required=_job_required, optional=None)
 
         ### Some yaml parameters don't directly correspond to condor ones. Treat those first.
         # These are just named differently to reflect their template character
@@ -374,68 +528,53 @@ class RuleConfig:
         arguments_tmpl=job_data.pop("arguments",None)
         if arguments_tmpl:
             # WARN("Using 'arguments' from the yaml file.")
-            ERROR("Yaml rule contains 'arguments' field. That almost certainly means the file is outdated.")
-            exit(2)
+            raise RuleConfigError("Yaml rule contains 'arguments' field. That almost certainly means the file is outdated.")
         else:
             arguments_tmpl=glob_arguments_tmpl
         job_data["arguments_tmpl"]=arguments_tmpl
 
         # Payload code etc.
-        payload_list  = job_data.pop("payload")
-        payload_list += param_overrides.get("payload_list",[])
+        payload_list  = job_data.pop("payload") + param_overrides.get("payload_list",[]) # new list, edited in place below
         # Prepend by the yaml file's path unless they are direct
-        yaml_path = Path(yaml_file).parent.resolve()
+        yaml_path = os.path.realpath(os.path.dirname(os.path.abspath(yaml_file))) # resolve the directory, not a symlinked file
         for i,loc in enumerate(payload_list):
             if not loc.startswith("/"):
                 payload_list[i]= f'{yaml_path}/{loc}'
-        DEBUG(f'List of payload items is {payload_list}')
+        DEBUG('List of payload items is %s', payload_list)
 
         # Filesystem paths
-        filesystem = _default_filesystem.copy()
+        fs_tmpl = _default_filesystem
         custom_fs = job_data.get("filesystem",None)
         if custom_fs:
             INFO("Updating default filesystem paths with custom paths from YAML file")
-            filesystem.update(custom_fs)
+            fs_tmpl = {**_default_filesystem, **custom_fs}
         else:
             INFO("Using default filesystem paths")
 
-        # Partially substitute placeholders.
-        for key in filesystem:
-            filesystem[key]=filesystem[key].format( prodmode=param_overrides["prodmode"],
-                                                    period=params_data["period"],
-                                                    physicsmode=physicsmode,
-                                                    outtriplet=outtriplet,
-                                                    leafdir='{leafdir}',
-                                                    rungroup='{rungroup}',
-                                                    )
-            DEBUG(f"{key}:\t {filesystem[key]}")
+        # Partially substitute placeholders. Others, like "{leafdir}" and "{rungroup}", stay for later
+        fs_subs = KeepPlaceholders( prodmode    = param_overrides["prodmode"],
+                                    period      = params_data["period"],
+                                    physicsmode = physicsmode,
+                                    outtriplet  = outtriplet,
+                                   )
+        # custom paths may be plain literals, nothing to parse then
+        filesystem = { key: path.format_map(fs_subs) if '{' in path else path for key, path in fs_tmpl.items() }
+        if slogger.isEnabledFor(logging.DEBUG):
+            DEBUG("Filesystem:\n%s", "\n".join(f"{key}:\t {path}" for key, path in filesystem.items()))
         job_data["filesystem"]=filesystem
 
         # The executable
         script = job_data.pop("script")
         # Adjust the executable's path
         if not script.startswith("/"): # Search in the payload unless script has an absolute path
-            p = subprocess.Popen(f'/usr/bin/find {" ".join(payload_list)} -type f',
-                                 shell=True, # needed to expand "*"
-                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = p.communicate()
-            errfiles = stderr.decode(errors='ignore').splitlines()
-            if errfiles:
-                WARN("The following errors occurred while searching the payload:")
-                for errf in errfiles:
-                    WARN(errf)
-            allfiles = stdout.decode(errors='ignore').split()
-            for f in allfiles:
-                if script == Path(f).name:
-                    script = f
-                    break
-        INFO(f'Full path to script is {script}')
-        if not Path(script).exists() :
-            ERROR(f"Executable {script} does not exist")
-            exit(2)
-        if not is_executable(Path(script)):
-            ERROR(f"{script} is not executable")
-            exit(2)
+            script = find_in_payload(payload_list, script) or script
+        INFO('Full path to script is %s', script)
+        try: # one stat answers both existence and file type; os.access then checks against our uid
+            script_mode = os.stat(script).st_mode
+        except OSError:
+            raise RuleConfigError(f"Executable {script} does not exist")
+        if not stat.S_ISREG(script_mode) or not os.access(script, os.X_OK):
+            raise RuleConfigError(f"{script} is not executable")
         job_data["executable"]=script
 
         # Some tedium to deal with a now deprecated field.
@@ -446,8 +585,7 @@ class RuleConfig:
             if not request_memory:
                 job_data["request_memory"]=mem
             elif request_memory != mem:
-                ERROR("Conflicting 'mem' (deprecated) and  'request_memory' fields.")
-                exit(2)
+                raise RuleConfigError("Conflicting 'mem' (deprecated) and  'request_memory' fields.")
 
         # for k,v in job_data.items():
         #     print(f"{k}:\t {v}")
@@ -455,49 +593,32 @@ class RuleConfig:
         # Partially fill param_overrides into the job data
         ## This isn't particularly elegant since it's self-referential.
         ## And you can't pass **job_data, which would be ideal, because of name clashes
+        # The substitution context is the same for every field, so merge it only once
+        # Per-job placeholders like {outbase}, {logbase}, {run}, {seg}, {inputs} are passed forward to be replaced later
+        field_subs = KeepPlaceholders({
+            **params_data,
+            **filesystem,
+            **shallow_dict(input_config), # only read for formatting, no need for a deep copy
+            'nevents'    : param_overrides["nevents"],
+            'payload'    : ",".join(payload_list),
+            'comment'    : job_data.get("comment",None),
+            'neventsper' : job_data.get("neventsper"),
+            'buildarg'   : params_data["build"],
+            'tag'        : params_data["dbtag"],
+            'outtriplet' : outtriplet,
+        })
         for field in 'batch_name', 'arguments_tmpl','log_tmpl':
             subsval = job_data.get(field)
-            if not isinstance(subsval, str): # don't try changing None or dictionaries
+            if not isinstance(subsval, str) or '{' not in subsval: # don't try changing None, dictionaries or plain literals
                 continue
-            subsval = subsval.format(
-                nevents=param_overrides["nevents"],
-                **params_data,
-                **filesystem,
-                **asdict(input_config),
-                payload=",".join(payload_list),
-                comment=job_data.get("comment",None),
-                neventsper=job_data.get("neventsper"),
-                buildarg=params_data["build"],
-                tag=params_data["dbtag"],
-                outtriplet=outtriplet,
-                # pass remaining per-job parameters forward to be replaced later
-                outbase='{outbase}',
-                logbase='{logbase}',
-                inbase='{inbase}',
-                run='{run}',
-                seg='{seg}',
-                daqhost='{daqhost}',
-                inputs='{inputs}',
-            )
+            subsval = subsval.format_map(field_subs)
             job_data[field] = subsval
-            DEBUG(f"After substitution, {field} is {subsval}")
+            DEBUG("After substitution, %s is %s", field, subsval)
         environment=f'SPHENIXPROD_SCRIPT_PATH={param_overrides.get("script_path","None")}'
         job_data["environment"]=environment
 
         # catch different production branches - prepend by branch if not main
-        branch_name="main"
-        try:
-            result = subprocess.run(
-                [f"git -C {Path(__file__).parent} rev-parse --abbrev-ref HEAD"],
-                shell=True,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            branch_name = result.stdout.strip()
-            CHATTY(f"Current Git branch: {branch_name}")
-        except Exception as e:
-            print(f"An error occurred: {e}")
+        branch_name=git_branch()
         batch_name=job_data.pop("batch_name")
         job_data["batch_name"]=f"{branch_name}.{batch_name}"
 
@@ -505,7 +626,7 @@ class RuleConfig:
         condor_job_dict={}
         for param in job_data:
             if param not in CondorJobConfig_fieldnames:
-                WARN( f"Unexpected field '{param}' in params. Removing, but you should clean up the yaml")
+                WARN( "Unexpected field '%s' in params. Removing, but you should clean up the yaml", param)
                 # raise ValueError(f"Unexpected field '{param}'.")
                 continue
             condor_job_dict[param] = job_data[param]
@@ -535,10 +656,8 @@ class RuleConfig:
 
         #####  Now instantiate the main condor config object for all jobs
         job_config=CondorJobConfig(**condor_job_dict) # Do NOT forget the ** for Dictionary Unpacking
-        DebugString="CondorJobConfig:\n"
-        for k,v in asdict(job_config).items():
-            DebugString += f"{k}:\t {v} \n"
-        DEBUG(DebugString)
+        if slogger.isEnabledFor(logging.DEBUG): # only build the dump when it's shown
+            DEBUG("CondorJobConfig:\n%s", "".join(f"{k}:\t {v} \n" for k,v in shallow_dict(job_config).items()))
 
         ### With all preparations done, construct the constant RuleConfig object
         return cls(
@@ -570,14 +689,29 @@ class RuleConfig:
         Returns:
             A RuleConfig objects, keyed by rule name.
         """
+        yaml_path = os.path.abspath(yaml_file)
         try:
-            with open(yaml_file, "r") as yamlstream:
-                yaml_data = yaml.safe_load(yamlstream)
-        except yaml.YAMLError as exc:
-            raise ValueError(f"Error parsing YAML file: {exc}")
+            st = os.stat(yaml_path)
         except FileNotFoundError:
             raise FileNotFoundError(f"YAML file not found: {yaml_file}")
 
+        cached = _yaml_cache.get(yaml_path)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            yaml_data = cached[2]
+        else:
+            yaml_data = _load_json_sidecar(yaml_path, st)
+            if yaml_data is None:
+                try:
+                    with open(yaml_path, "rb") as yamlstream:
+                        yaml_data = yaml.load(yamlstream, Loader=YamlLoader)
+                except yaml.YAMLError as exc:
+                    raise ValueError(f"Error parsing YAML file: {exc}")
+                except FileNotFoundError:
+                    raise FileNotFoundError(f"YAML file not found: {yaml_file}")
+                _write_json_sidecar(yaml_path, st, yaml_data)
+            _yaml_cache[yaml_path] = (st.st_mtime_ns, st.st_size, yaml_data)
+
+        # from_yaml doesn't modify its input, so the cached data can be shared
         return cls.from_yaml(yaml_file=yaml_file,
                              yaml_data=yaml_data,
                              rule_name=rule_name,
@@ -589,12 +723,14 @@ def parse_spiderstuff(filename: str) -> Tuple[str,...] :
     try:
         size=-1
         ctime=-1
-        if 'size' in filename and 'ctime'in filename:
-            lfn,_,nevents,_,first,_,last,_,md5,_,size,_,ctime,_,dbid = filename.split(':')
+        # One split; the field count tells the long (size, ctime) form from the short one
+        parts=filename.split(':')
+        if len(parts)==15:
+            lfn,_,nevents,_,first,_,last,_,md5,_,size,_,ctime,_,dbid = parts
         else:
-            lfn,_,nevents,_,first,_,last,_,md5,_,dbid = filename.split(':')
+            lfn,_,nevents,_,first,_,last,_,md5,_,dbid = parts
 
-        lfn=Path(lfn).name
+        lfn=os.path.basename(lfn)
     except Exception as e:
         ERROR(f"Error: {e}")
         print(filename)
@@ -0,0 +1,31 @@
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def sphenixdbutils(monkeypatch):
+    # The odbc driver is only needed to talk to the databases, not for building query strings
+    monkeypatch.setitem(sys.modules, "pyodbc", types.ModuleType("pyodbc"))
+    import sphenixdbutils
+
+    return sphenixdbutils
+
+
+# list_to_condition turns runlist_int into the runnumber clause of the file catalog queries
+@pytest.mark.parametrize("runs, expected", [
+    ([3, 1, 2], "runnumber>=1 and runnumber<=3"),
+    ([1, 2, 5], "runnumber in  ( 1,2,5 )"),
+    (range(100, 201), "runnumber>=100 and runnumber<=200"),
+    ([7], "runnumber=7"),
+    (list(range(1, 30000)), "runnumber>=1 and runnumber<=29999"),
+])
+def test_list_to_condition(sphenixdbutils, runs, expected):
+    assert sphenixdbutils.list_to_condition(runs) == expected
+
+
+def test_list_to_condition_rejects_huge_list_with_gaps(sphenixdbutils):
+    with pytest.raises(SystemExit) as excinfo:
+        sphenixdbutils.list_to_condition(list(range(1, 60000, 2)))
+    assert excinfo.value.code == 2
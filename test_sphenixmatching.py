@@ -0,0 +1,61 @@
+import sqlite3
+import sys
+import types
+
+import pytest
+
+from sphenixprodrules import InputConfig
+
+IN_TYPES = ["DST_TRKR_SEED", "DST_TRKR_CLUSTER"]
+INFILE_QUERY = """select filename,dsttype as daqhost,runnumber,segment,'1' as status
+        from datasets
+        where dsttype in ( 'DST_TRKR_SEED','DST_TRKR_CLUSTER' )
+        \tand tag='in_v001'"""
+
+
+@pytest.fixture
+def match_config(monkeypatch):
+    # sphenixdbutils needs the odbc driver at import; the queries here run against sqlite instead
+    monkeypatch.setitem(sys.modules, "pyodbc", types.ModuleType("pyodbc"))
+    from sphenixmatching import MatchConfig
+
+    return MatchConfig(
+        dsttype="DST_TRKR_TRACKS", runlist_int=[1000], input_config=InputConfig(db="fcr", table="datasets", infile_query_constraints=""),
+        dataset="run3pp", outtriplet="out_v001", physicsmode="physics", filesystem={}, rungroup_tmpl="", job_config=None,
+        dst_type_template="DST_TRKR_TRACKS", in_types=IN_TYPES, input_stem=IN_TYPES,
+        in_types_sql="( 'DST_TRKR_SEED','DST_TRKR_CLUSTER' )",
+    )
+
+
+def catalog(inputs, done):
+    cnxn = sqlite3.connect(":memory:")
+    cnxn.execute("create table datasets (filename text, runnumber int, segment int, dataset text, dsttype text, tag text)")
+    rows = [(f"{dsttype}-{seg}.root", 1000, seg, "run3pp", dsttype, "in_v001") for dsttype, segs in inputs.items() for seg in segs]
+    rows += [(f"DST_TRKR_TRACKS-{seg}.root", 1000, seg, "run3pp", "DST_TRKR_TRACKS", "out_v001") for seg in done]
+    cnxn.executemany("insert into datasets values (?,?,?,?,?,?)", rows)
+    return cnxn
+
+
+def segments_by_stream(cnxn, query):
+    found = {}
+    for _, daqhost, _, segment, _ in cnxn.execute(query):
+        found.setdefault(daqhost, set()).add(segment)
+    return found
+
+
+def test_run_infile_query_keeps_segments_present_in_all_streams(match_config):
+    cnxn = catalog({"DST_TRKR_SEED": range(6), "DST_TRKR_CLUSTER": range(11)}, done=[])
+    found = segments_by_stream(cnxn, match_config.run_infile_query(INFILE_QUERY, 1000))
+    assert found == {"DST_TRKR_SEED": set(range(6)), "DST_TRKR_CLUSTER": set(range(6))}
+
+
+def test_run_infile_query_with_one_stream_behind(match_config):
+    # SEED is complete only up to segment 5, and all of those are done. Nothing is left to make,
+    # in particular no jobs for segments 6-10 from CLUSTER inputs alone.
+    cnxn = catalog({"DST_TRKR_SEED": range(6), "DST_TRKR_CLUSTER": range(11)}, done=range(6))
+    assert segments_by_stream(cnxn, match_config.run_infile_query(INFILE_QUERY, 1000)) == {}
+
+    # Partially done: the remaining segments still come with every stream
+    cnxn = catalog({"DST_TRKR_SEED": range(6), "DST_TRKR_CLUSTER": range(11)}, done=range(3))
+    found = segments_by_stream(cnxn, match_config.run_infile_query(INFILE_QUERY, 1000))
+    assert found == {"DST_TRKR_SEED": {3, 4, 5}, "DST_TRKR_CLUSTER": {3, 4, 5}}
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from sphenixmisc import prefetched
+
+
+def test_prefetched_preserves_order():
+    # Later items finish first
+    def slow_for_small(i):
+        time.sleep(0.002 * (10 - i))
+        return i * i
+
+    assert list(prefetched(slow_for_small, range(10), workers=4)) == [(i, i * i) for i in range(10)]
+
+
+def test_prefetched_raises_in_consumer():
+    def fails_on_three(i):
+        if i == 3:
+            raise ValueError("bad item")
+        return i
+
+    seen = []
+    with pytest.raises(ValueError, match="bad item"):
+        for item, _ in prefetched(fails_on_three, range(10), workers=4):
+            seen.append(item)
+    assert seen == [0, 1, 2]
+
+
+def test_prefetched_cancels_pending_on_close(monkeypatch):
+    cancelled = []
+    original_cancel = Future.cancel
+
+    def spy_cancel(self):
+        cancelled.append(self)
+        return original_cancel(self)
+
+    monkeypatch.setattr(Future, "cancel", spy_cancel)
+
+    called = []
+
+    def record(i):
+        called.append(i)
+        time.sleep(0.01)
+        return i
+
+    gen = prefetched(record, range(100), workers=3)
+    assert next(gen) == (0, 0)
+    gen.close()
+
+    # Everything still in the window was cancelled, nothing past it was submitted
+    assert len(cancelled) == 3
+    assert set(called) <= {0, 1, 2, 3}
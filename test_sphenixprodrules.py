@@ -0,0 +1,126 @@
+import pytest
+
+from sphenixprodrules import RuleConfig, RuleConfigError, check_params, find_in_payload, input_dsttypes
+
+
+def test_check_params_removes_unexpected_fields():
+    params = {"dsttype": "DST_CALO", "period": "run3auau", "bogus": 1}
+
+    assert check_params(params, required=["dsttype", "period"], optional=["dataset"]) is False
+    assert params == {"dsttype": "DST_CALO", "period": "run3auau"}
+
+
+def test_check_params_clean_input():
+    params = {"dsttype": "DST_CALO", "dataset": "run3auau"}
+
+    assert check_params(params, required=["dsttype"], optional=["dataset"]) is True
+
+
+def test_check_params_without_optional_keeps_everything():
+    params = {"script": "run.sh", "extra": "kept"}
+
+    assert check_params(params, required=["script"], optional=None) is True
+    assert "extra" in params
+
+
+def test_check_params_missing_required_raises():
+    with pytest.raises(ValueError, match="Missing required field 'period'"):
+        check_params({"dsttype": "DST_CALO"}, required=["dsttype", "period"], optional=[])
+
+
+def test_from_yaml_raises_with_exit_code(monkeypatch):
+    import sphenixprodrules
+
+    # No build directory on /cvmfs, independent of the host the test runs on
+    monkeypatch.setattr(sphenixprodrules.glob, "glob", lambda *a, **k: [])
+    yaml_data = {"RULE": {"params": {"dsttype": "DST_CALO", "period": "run3auau",
+                                     "build": "no_such_build_tag", "dbtag": "nocdbtag", "version": 1}}}
+    with pytest.raises(RuleConfigError, match="no_such_build_tag") as excinfo:
+        RuleConfig.from_yaml(yaml_file="rules.yaml", yaml_data=yaml_data, rule_name="RULE", param_overrides={})
+    assert excinfo.value.exitcode == 3
+
+
+def test_input_dsttypes():
+    assert input_dsttypes("DST_CALO") == (("DST_CALOFITTING",), "DST_CALOFITTING")
+    indsttype, indsttype_str = input_dsttypes("DST_TRIGGERED_EVENT")
+    assert indsttype_str == ",".join(indsttype) and "seb20" in indsttype
+    with pytest.raises(ValueError, match="DST_BOGUS"):
+        input_dsttypes("DST_BOGUS")
+
+
+def test_find_in_payload_searches_dirs_files_and_globs(tmp_path):
+    (tmp_path / "macros" / "sub").mkdir(parents=True)
+    script = tmp_path / "macros" / "sub" / "run.sh"
+    script.write_text("#!/bin/sh\n")
+    (tmp_path / "extra.C").write_text("")
+
+    assert find_in_payload([str(tmp_path / "extra.C"), str(tmp_path / "macros")], "run.sh") == str(script)
+    assert find_in_payload([str(tmp_path / "mac*")], "run.sh") == str(script)
+    assert find_in_payload([str(tmp_path / "extra.C")], "extra.C") == str(tmp_path / "extra.C")
+    assert find_in_payload([str(tmp_path / "missing")], "run.sh") is None
+
+
+def test_json_sidecar_roundtrip_and_invalidation(tmp_path, monkeypatch):
+    import datetime
+    import os
+    import sphenixprodrules
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.delenv("SPHENIXPROD_NO_YAML_CACHE", raising=False)
+    yaml_file = tmp_path / "rules.yaml"
+    yaml_file.write_text("RULE:\n  params: {dsttype: DST_CALO}\n")
+    yaml_path = str(yaml_file)
+    data = {"RULE": {"params": {"dsttype": "DST_CALO"}}}
+
+    st = os.stat(yaml_path)
+    sphenixprodrules._write_json_sidecar(yaml_path, st, data)
+    assert sphenixprodrules._load_json_sidecar(yaml_path, st) == data
+
+    yaml_file.write_text("RULE:\n  params: {dsttype: DST_CALO_FITTING}\n")
+    assert sphenixprodrules._load_json_sidecar(yaml_path, os.stat(yaml_path)) is None
+
+    # Values that don't survive JSON are not cached
+    sphenixprodrules._write_json_sidecar(yaml_path, os.stat(yaml_path), {"when": datetime.date(2025, 1, 1)})
+    assert sphenixprodrules._load_json_sidecar(yaml_path, os.stat(yaml_path)) is None
+
+
+def test_json_sidecar_disabled_or_homeless(tmp_path, monkeypatch):
+    import os
+    from pathlib import Path
+    import sphenixprodrules
+
+    yaml_file = tmp_path / "rules.yaml"
+    yaml_file.write_text("RULE: {}\n")
+    st = os.stat(yaml_file)
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("SPHENIXPROD_NO_YAML_CACHE", "1")
+    sphenixprodrules._write_json_sidecar(str(yaml_file), st, {"RULE": {}})
+    assert not (tmp_path / "cache").exists()
+    assert sphenixprodrules._load_json_sidecar(str(yaml_file), st) is None
+
+    def no_home():
+        raise RuntimeError("Could not determine home directory.")
+    monkeypatch.delenv("SPHENIXPROD_NO_YAML_CACHE")
+    monkeypatch.delenv("XDG_CACHE_HOME")
+    monkeypatch.setattr(Path, "home", staticmethod(no_home))
+    assert sphenixprodrules._json_cache_dir() is None
+    sphenixprodrules._write_json_sidecar(str(yaml_file), st, {"RULE": {}})
+
+
+def test_json_sidecar_failed_write_leaves_no_tmpfile(tmp_path, monkeypatch):
+    import os
+    import sphenixprodrules
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.delenv("SPHENIXPROD_NO_YAML_CACHE", raising=False)
+    def failing_fdopen(fd, *args, **kwargs):
+        os.close(fd)
+        raise OSError("disk full")
+    monkeypatch.setattr(sphenixprodrules.os, "fdopen", failing_fdopen)
+
+    yaml_file = tmp_path / "rules.yaml"
+    yaml_file.write_text("RULE: {}\n")
+    sphenixprodrules._write_json_sidecar(str(yaml_file), os.stat(yaml_file), {"RULE": {}})
+    assert list((tmp_path / "cache" / "sphenixprod" / "yaml").iterdir()) == []
+